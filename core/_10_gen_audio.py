@@ -14,6 +14,8 @@ from core.utils import *
 from core.utils.models import *
 from core.asr_backend.audio_preprocess import get_audio_duration
 from core.tts_backend.tts_main import tts_main
+from core.tts_backend.estimate_duration import init_estimator, estimate_duration
+from core.tts_backend.speaking_rate import calibrate_speaking_rate
 
 console = Console()
 
@@ -113,8 +115,18 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
                         raise e
 
     rprint("[bold green]✨ TTS audio generation completed![/bold green]")
+    fit_speaking_rate(tasks_df)
     return tasks_df
 
+def fit_speaking_rate(tasks_df: pd.DataFrame) -> None:
+    """Feed the real durations of this run back into the learned speaking rate of the voice"""
+    estimator = init_estimator(calibrated=False)
+    estimated = [
+        sum(estimate_duration(line, estimator) for line in (eval(lines) if isinstance(lines, str) else lines))
+        for lines in tasks_df['lines']
+    ]
+    calibrate_speaking_rate(estimated, tasks_df['real_dur'].tolist())
+
 def process_chunk(chunk_df: pd.DataFrame, accept: float, min_speed: float) -> tuple[float, bool]:
     """Process audio chunk and calculate speed factor"""
     chunk_durs = chunk_df['real_dur'].sum()
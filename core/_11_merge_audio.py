@@ -6,6 +6,7 @@ from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskPr
 from rich.console import Console
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_io import write_subtitles
 console = Console()
 
 DUB_VOCAL_FILE = 'output/dub.mp3'
@@ -85,14 +86,7 @@ def merge_audio_segments(audios, new_sub_times, sample_rate):
 def create_srt_subtitle():
     df, lines, new_sub_times = load_and_flatten_data(_8_1_AUDIO_TASK)
     
-    with open(DUB_SUB_FILE, 'w', encoding='utf-8') as f:
-        for i, ((start_time, end_time), line) in enumerate(zip(new_sub_times, lines), 1):
-            start_str = f"{int(start_time//3600):02d}:{int((start_time%3600)//60):02d}:{int(start_time%60):02d},{int((start_time*1000)%1000):03d}"
-            end_str = f"{int(end_time//3600):02d}:{int((end_time%3600)//60):02d}:{int(end_time%60):02d},{int((end_time*1000)%1000):03d}"
-            
-            f.write(f"{i}\n")
-            f.write(f"{start_str} --> {end_str}\n")
-            f.write(f"{line}\n\n")
+    write_subtitles(DUB_SUB_FILE, [start for start, _ in new_sub_times], [end for _, end in new_sub_times], lines)
     
     rprint(f"[bold green]✅ Subtitle file created: {DUB_SUB_FILE}[/bold green]")
 
@@ -1,14 +1,15 @@
 import platform
 import subprocess
 
-import cv2
-import numpy as np
 from rich.console import Console
 
 from core._1_ytdlp import find_video_files
 from core.asr_backend.audio_preprocess import normalize_audio_volume
 from core.utils import *
 from core.utils.models import *
+from core.utils.encoder_profile import video_encoder_args
+from core.utils.media_info import get_media_info
+from core.utils.mux import soft_output_path, subtitle_track_args, target_language_tag, write_placeholder_video
 
 console = Console()
 
@@ -28,20 +29,36 @@ TRANS_OUTLINE_COLOR = '&H000000'
 TRANS_OUTLINE_WIDTH = 1 
 TRANS_BACK_COLOR = '&H33000000'
 
+def mux_dub_tracks(video_file, background_file):
+    """Copy the video stream, add the mixed dubbing audio and the dubbing subtitles as tagged tracks.
+
+    Only the audio mix is encoded, the video is copied as is."""
+    normalized_dub_audio = 'output/normalized_dub.wav'
+    normalize_audio_volume(DUB_AUDIO, normalized_dub_audio)
+    output_video = soft_output_path(DUB_VIDEO)
+    target_tag = target_language_tag()
+    sub_inputs, sub_outputs = subtitle_track_args([(DUB_SUB_FILE, target_tag, 'Dubbing')], first_input=3)
+    cmd = [
+        'ffmpeg', '-v', 'error', '-y', '-i', video_file, '-i', background_file, '-i', normalized_dub_audio, *sub_inputs,
+        '-filter_complex', '[1:a][2:a]amix=inputs=2:duration=first:dropout_transition=3[a]',
+        '-map', '0:v:0', '-map', '[a]', *sub_outputs,
+        '-c:v', 'copy', '-c:a', 'aac', '-b:a', '96k', '-metadata:s:a:0', f'language={target_tag}', output_video
+    ]
+    subprocess.run(cmd, check=True)
+    rprint(f"[bold green]Dubbing audio and subtitles muxed into {output_video}[/bold green]")
+
 def merge_video_audio():
     """Merge video and audio, and reduce video volume"""
     VIDEO_FILE = find_video_files()
     background_file = _BACKGROUND_AUDIO_FILE
     
+    if not load_key("burn_subtitles") and load_key("soft_subtitles.enabled"):
+        mux_dub_tracks(VIDEO_FILE, background_file)
+        return
     if not load_key("burn_subtitles"):
         rprint("[bold yellow]Warning: A 0-second black video will be generated as a placeholder as subtitles are not burned in.[/bold yellow]")
 
-        # Create a black frame
-        frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(DUB_VIDEO, fourcc, 1, (1920, 1080))
-        out.write(frame)
-        out.release()
+        write_placeholder_video(DUB_VIDEO)
 
         rprint("[bold green]Placeholder video has been generated.[/bold green]")
         return
@@ -51,10 +68,8 @@ def merge_video_audio():
     normalize_audio_volume(DUB_AUDIO, normalized_dub_audio)
     
     # Merge video and audio with translated subtitles
-    video = cv2.VideoCapture(VIDEO_FILE)
-    TARGET_WIDTH = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-    TARGET_HEIGHT = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    video.release()
+    media = get_media_info(VIDEO_FILE)
+    TARGET_WIDTH, TARGET_HEIGHT = media.width, media.height
     rprint(f"[bold green]Video resolution: {TARGET_WIDTH}x{TARGET_HEIGHT}[/bold green]")
     
     subtitle_filter = (
@@ -75,9 +90,7 @@ def merge_video_audio():
 
     if load_key("ffmpeg_gpu"):
         rprint("[bold green]Using GPU acceleration...[/bold green]")
-        cmd.extend(['-map', '[v]', '-map', '[a]', '-c:v', 'h264_nvenc'])
-    else:
-        cmd.extend(['-map', '[v]', '-map', '[a]'])
+    cmd.extend(['-map', '[v]', '-map', '[a]', *video_encoder_args()])
     
     cmd.extend(['-c:a', 'aac', '-b:a', '96k', DUB_VIDEO])
     
@@ -1,9 +1,11 @@
 import concurrent.futures
 from difflib import SequenceMatcher
 import math
-from core.prompts import get_split_prompt
+from core.prompts import get_split_prompt, get_split_batch_prompt
 from core.spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.split_by_rules import rule_split
 from core.utils import *
+from core.utils.ask_gpt import REQUEST_STATS, record_stat
 from rich.console import Console
 from rich.table import Table
 from core.utils.models import _3_1_SPLIT_BY_NLP, _3_2_SPLIT_BY_MEANING
@@ -13,6 +15,42 @@ def tokenize_sentence(sentence, nlp):
     doc = nlp(sentence)
     return [token.text for token in doc]
 
+def _best_split_point(original, start, target):
+    """Find the first `j` maximizing ratio(original[start:j], target), scanning lengths outwards from len(target).
+
+    ratio() is bounded by 2*min(la, lb)/(la+lb), so once a good match is found only a narrow band of
+    candidate lengths has to be compared. The result is identical to an exhaustive scan over every `j`."""
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(target)  # b2j of the target is built once and reused for every candidate
+    lb = len(target)
+    max_la = len(original) - 1 - start
+    best_ratio, best_j = 0, None
+
+    def try_candidate(la):
+        nonlocal best_ratio, best_j
+        total = la + lb
+        if total and 2.0 * min(la, lb) / total < best_ratio:
+            return
+        j = start + la
+        matcher.set_seq1(original[start:j])
+        if matcher.quick_ratio() < best_ratio:
+            return
+        ratio = matcher.ratio()
+        if ratio > best_ratio or (ratio == best_ratio and ratio > 0 and j < best_j):
+            best_ratio, best_j = ratio, j
+
+    for d in range(max(lb, max_la - lb) + 1):
+        longer, shorter = lb + d, lb - d
+        # the longer candidate always has the looser bound, stop once even that can't reach the best
+        if best_ratio > 0 and 2.0 * lb / (longer + lb) < best_ratio:
+            break
+        if 0 <= shorter <= max_la:
+            try_candidate(shorter)
+        if d > 0 and longer <= max_la:
+            try_candidate(longer)
+
+    return best_ratio, best_j
+
 def find_split_positions(original, modified):
     split_positions = []
     parts = modified.split('[br]')
@@ -22,18 +60,8 @@ def find_split_positions(original, modified):
     joiner = get_joiner(language)
 
     for i in range(len(parts) - 1):
-        max_similarity = 0
-        best_split = None
-
-        for j in range(start, len(original)):
-            original_left = original[start:j]
-            modified_left = joiner.join(parts[i].split())
-
-            left_similarity = SequenceMatcher(None, original_left, modified_left).ratio()
-
-            if left_similarity > max_similarity:
-                max_similarity = left_similarity
-                best_split = j
+        modified_left = joiner.join(parts[i].split())
+        max_similarity, best_split = _best_split_point(original, start, modified_left)
 
         if max_similarity < 0.9:
             console.print(f"[yellow]Warning: low similarity found at the best split point: {max_similarity}[/yellow]")
@@ -45,20 +73,8 @@ def find_split_positions(original, modified):
 
     return split_positions
 
-def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
-    """Split a long sentence using GPT and return the result as a string."""
-    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
-    def valid_split(response_data):
-        choice = response_data["choice"]
-        if f'split{choice}' not in response_data:
-            return {"status": "error", "message": "Missing required key: `split`"}
-        if "[br]" not in response_data[f"split{choice}"]:
-            return {"status": "error", "message": "Split failed, no [br] found"}
-        return {"status": "success", "message": "Split completed"}
-    
-    response_data = ask_gpt(split_prompt + " " * retry_attempt, resp_type='json', valid_def=valid_split, log_title='split_by_meaning')
-    choice = response_data["choice"]
-    best_split = response_data[f"split{choice}"]
+def apply_split(sentence, best_split, index=-1):
+    """Map the [br] tags of the GPT answer back onto the original sentence, return parts joined by newlines."""
     split_points = find_split_positions(sentence, best_split)
     # split the sentence based on the split points
     for i, split_point in enumerate(split_points):
@@ -80,30 +96,133 @@ def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0
     
     return best_split
 
-def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0):
+def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
+    """Split a long sentence using GPT and return the result as a string."""
+    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
+    def valid_split(response_data):
+        choice = response_data["choice"]
+        if f'split{choice}' not in response_data:
+            return {"status": "error", "message": "Missing required key: `split`"}
+        if "[br]" not in response_data[f"split{choice}"]:
+            return {"status": "error", "message": "Split failed, no [br] found"}
+        return {"status": "success", "message": "Split completed"}
+    
+    response_data = ask_gpt(split_prompt + " " * retry_attempt, resp_type='json', valid_def=valid_split, log_title='split_by_meaning')
+    choice = response_data["choice"]
+    return apply_split(sentence, response_data[f"split{choice}"], index)
+
+def pack_split_batches(items, max_tokens):
+    """Greedily pack (index, sentence, num_parts) items into batches within the token budget."""
+    batches, batch, batch_tokens = [], [], 0
+    for item in items:
+        tokens = estimate_tokens(item[1])
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def split_sentences_batch(batch, word_limit=20, retry_attempt=0):
+    """Split several long sentences with one GPT request, return {index: split_result}.
+
+    Every item is validated on its own, only the failed ones are asked again, and whatever still fails
+    falls back to one `split_sentence` request per sentence."""
+    def valid_batch(response_data):
+        if not isinstance(response_data, dict) or not response_data:
+            return {"status": "error", "message": "Response is not a JSON object"}
+        return {"status": "success", "message": "Split completed"}
+
+    def valid_item(item, sentence):
+        split = item.get('split') if isinstance(item, dict) else None
+        if not isinstance(split, str) or '[br]' not in split:
+            return None
+        # make sure the item belongs to this sentence and no words were rewritten
+        if SequenceMatcher(None, ''.join(sentence.split()), ''.join(split.replace('[br]', '').split())).ratio() < 0.9:
+            return None
+        return split
+
+    results = {}
+    pending = list(batch)
+    for attempt in range(2):
+        split_prompt = get_split_batch_prompt([(sentence, num_parts) for _, sentence, num_parts in pending], word_limit)
+        try:
+            response_data = ask_gpt(split_prompt + " " * (retry_attempt + attempt), resp_type='json', valid_def=valid_batch, log_title='split_by_meaning_batch')
+        except Exception as e:
+            record_stat('split_by_meaning_batch', 'batch_errors')
+            console.print(f'[red]❌ Batch split request of {len(pending)} sentences failed, splitting them one by one: {e}[/red]')
+            break
+        failed = []
+        for i, (index, sentence, num_parts) in enumerate(pending, 1):
+            split = valid_item(response_data.get(str(i)), sentence)
+            if split is None:
+                failed.append((index, sentence, num_parts))
+            else:
+                results[index] = apply_split(sentence, split, index)
+        record_stat('split_by_meaning_batch', 'item_failures', len(failed))
+        pending = failed
+        if not pending:
+            break
+        console.print(f'[yellow]⚠️ {len(pending)} of {len(batch)} sentences in the batch failed to split, retrying...[/yellow]')
+
+    record_stat('split_by_meaning_batch', 'fallback_sentences', len(pending))
+    for index, sentence, num_parts in pending:
+        results[index] = split_sentence(sentence, num_parts, word_limit, index=index, retry_attempt=retry_attempt)
+    return results
+
+def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0, stats=None):
     """Split sentences in parallel using a thread pool."""
     new_sentences = [None] * len(sentences)
-    futures = []
+    pending = []
+    rule_set = load_key("rule_split")
+    whisper_language = load_key("whisper.language")
+    joiner = get_joiner(load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language)
+    batch_set = load_key("split_batch")
+    stats = stats if stats is not None else {'long': 0, 'by_rules': 0, 'llm_avoided': 0}
+
+    def split_one(index, sentence, num_parts):
+        return {index: split_sentence(sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)}
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         for index, sentence in enumerate(sentences):
             # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            # print("Tokenization result:", tokens)
-            num_parts = math.ceil(len(tokens) / max_length)
-            if len(tokens) > max_length:
-                future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
+            doc = nlp(sentence)
+            num_parts = math.ceil(len(doc) / max_length)
+            if len(doc) > max_length:
+                # long sentences of the transcript are counted in the first pass, later passes only see
+                # parts that are still too long, but a rule split there still saves an LLM call
+                if retry_attempt == 0:
+                    stats['long'] += 1
+                # try the local rules first, only ambiguous sentences go to the LLM
+                rule_parts = rule_split(doc, max_length, rule_set, joiner)
+                if rule_parts:
+                    stats['llm_avoided'] += 1
+                    if retry_attempt == 0:
+                        stats['by_rules'] += 1
+                    console.print(f'[green]✅ Sentence {index} split by rules: {" || ".join(rule_parts)}[/green]')
+                    new_sentences[index] = rule_parts
+                else:
+                    pending.append((index, sentence, num_parts))
             else:
                 new_sentences[index] = [sentence]
 
-        for future, index, num_parts, sentence in futures:
-            split_result = future.result()
-            if split_result:
-                split_lines = split_result.strip().split('\n')
-                new_sentences[index] = [line.strip() for line in split_lines]
-            else:
-                new_sentences[index] = [sentence]
+        if batch_set['enabled']:
+            batches = pack_split_batches(pending, batch_set['max_tokens'])
+            if batches:
+                console.print(f'[cyan]📦 Packed {len(pending)} long sentences into {len(batches)} split requests[/cyan]')
+            futures = [executor.submit(split_sentences_batch, batch, max_length, retry_attempt) for batch in batches]
+        else:
+            futures = [executor.submit(split_one, *item) for item in pending]
+
+        for future in futures:
+            for index, split_result in future.result().items():
+                if split_result:
+                    split_lines = split_result.strip().split('\n')
+                    new_sentences[index] = [line.strip() for line in split_lines]
+                else:
+                    new_sentences[index] = [sentences[index]]
 
     return [sentence for sublist in new_sentences for sentence in sublist]
 
@@ -115,9 +234,15 @@ def split_sentences_by_meaning():
         sentences = [line.strip() for line in f.readlines()]
 
     nlp = init_nlp()
+    stats = {'long': 0, 'by_rules': 0, 'llm_avoided': 0}
     # 🔄 process sentences multiple times to ensure all are split
     for retry_attempt in range(3):
-        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt)
+        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt, stats=stats)
+    console.print(f"[cyan]📊 Rule-based splitter resolved {stats['by_rules']}/{stats['long']} long sentences, {stats['llm_avoided']} LLM calls avoided[/cyan]")
+    batch_stats = REQUEST_STATS['split_by_meaning_batch']
+    if batch_stats['batch_errors'] or batch_stats['fallback_sentences']:
+        console.print(f"[yellow]📦 Batch split: {batch_stats['batch_errors']} failed requests, {batch_stats['item_failures']} invalid items, "
+                      f"{batch_stats['fallback_sentences']} sentences fell back to single requests[/yellow]")
 
     # 💾 save results
     with open(_3_2_SPLIT_BY_MEANING, 'w', encoding='utf-8') as f:
@@ -1,37 +1,82 @@
+import os
 import json
-from core.prompts import get_summary_prompt
+import time
+import threading
+import concurrent.futures
+from collections import Counter
+from core.prompts import get_summary_prompt, get_theme_merge_prompt
 import pandas as pd
 from core.utils import *
+from core.utils.term_index import TermIndex
 from core.utils.models import _3_2_SPLIT_BY_MEANING, _4_1_TERMINOLOGY
 
 CUSTOM_TERMS_PATH = 'custom_terms.xlsx'
+MAX_TERMS = 15  # extracted terms kept after the merge, the limit of the former single summary request
 
-def combine_chunks():
-    """Combine the text chunks identified by whisper into a single long text"""
+def split_into_windows(window_size):
+    """Split the whole transcript into windows of about `window_size` characters on sentence boundaries"""
     with open(_3_2_SPLIT_BY_MEANING, 'r', encoding='utf-8') as file:
-        sentences = file.readlines()
-    cleaned_sentences = [line.strip() for line in sentences]
-    combined_text = ' '.join(cleaned_sentences)
-    return combined_text[:load_key('summary_length')]  #! Return only the first x characters
+        sentences = [line.strip() for line in file.readlines() if line.strip()]
+    windows, window = [], ''
+    for sentence in sentences:
+        if window and len(window) + len(sentence) + 1 > window_size:
+            windows.append(window)
+            window = ''
+        window = f'{window} {sentence}' if window else sentence
+    if window:
+        windows.append(window)
+    return windows
+
+def merge_terms(window_terms, exclude_srcs=(), max_terms=MAX_TERMS):
+    """Deduplicate the terms extracted from all windows, ranked by how many windows extracted them, and keep
+    the `max_terms` best ranked.
+
+    When windows disagree on a translation, the most frequent one wins."""
+    excluded = {str(src).lower().strip() for src in exclude_srcs}
+    merged = {}
+    for order, terms in enumerate(window_terms):
+        for term in terms:
+            key = str(term['src']).lower().strip()
+            if not key or key in excluded:
+                continue
+            entry = merged.setdefault(key, {'term': term, 'count': 0, 'first': order, 'tgt_votes': Counter()})
+            entry['count'] += 1
+            entry['tgt_votes'][term['tgt']] += 1
+    ranked = sorted(merged.values(), key=lambda e: (-e['count'], e['first']))[:max_terms]
+    return [{**e['term'], 'tgt': e['tgt_votes'].most_common(1)[0][0]} for e in ranked]
+
+_TERM_INDEX_LOCK = threading.Lock()
+_TERM_INDEX = {'mtime': None, 'index': None}
+
+def load_term_index():
+    """Build the terminology index once per run, rebuild only when terminology.json is edited"""
+    with _TERM_INDEX_LOCK:
+        mtime = os.path.getmtime(_4_1_TERMINOLOGY)
+        if _TERM_INDEX['mtime'] != mtime:
+            with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
+                terms = json.load(file)['terms']
+            whisper_language = load_key("whisper.language")
+            language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
+            _TERM_INDEX['index'] = TermIndex(terms, word_boundary=get_joiner(language) == " ")
+            _TERM_INDEX['mtime'] = mtime
+        return _TERM_INDEX['index']
 
 def search_things_to_note_in_prompt(sentence):
     """Search for terms to note in the given sentence"""
-    with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
-        things_to_note = json.load(file)
-    things_to_note_list = [term['src'] for term in things_to_note['terms'] if term['src'].lower() in sentence.lower()]
-    if things_to_note_list:
+    index = load_term_index()
+    matched = index.search(sentence)
+    if matched:
         prompt = '\n'.join(
-            f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
-            f' meaning: {term["note"]}'
-            for i, term in enumerate(things_to_note['terms'])
-            if term['src'] in things_to_note_list
+            f'{i+1}. "{index.terms[i]["src"]}": "{index.terms[i]["tgt"]}",'
+            f' meaning: {index.terms[i]["note"]}'
+            for i in matched
         )
         return prompt
     else:
         return None
 
 def get_summary():
-    src_content = combine_chunks()
+    windows = split_into_windows(load_key('summary_length'))
     custom_terms = pd.read_excel(CUSTOM_TERMS_PATH)
     custom_terms_json = {
         "terms": 
@@ -47,8 +92,8 @@ def get_summary():
     if len(custom_terms) > 0:
         rprint(f"📖 Custom Terms Loaded: {len(custom_terms)} terms")
         rprint("📝 Terms Content:", json.dumps(custom_terms_json, indent=2, ensure_ascii=False))
-    summary_prompt = get_summary_prompt(src_content, custom_terms_json)
-    rprint("📝 Summarizing and extracting terminology ...")
+    custom_index = TermIndex(custom_terms_json['terms'])
+    rprint(f"📝 Summarizing and extracting terminology over {len(windows)} windows ...")
     
     def valid_summary(response_data):
         required_keys = {'src', 'tgt', 'note'}
@@ -59,8 +104,35 @@ def get_summary():
                 return {"status": "error", "message": "Invalid response format"}   
         return {"status": "success", "message": "Summary completed"}
 
-    summary = ask_gpt(summary_prompt, resp_type='json', valid_def=valid_summary, log_title='summary')
-    summary['terms'].extend(custom_terms_json['terms'])
+    def summarize_window(window):
+        # only list the custom terms that occur in this window as existing terms
+        window_custom_terms = {"terms": [custom_terms_json['terms'][i] for i in custom_index.search(window)]}
+        start_time = time.time()
+        summary = ask_gpt(get_summary_prompt(window, window_custom_terms), resp_type='json', valid_def=valid_summary, log_title='summary')
+        return summary, time.time() - start_time
+
+    # 🗺️ map: extract terms from every window concurrently
+    start_time = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+        window_results = list(executor.map(summarize_window, windows))
+    summaries = [summary for summary, _ in window_results]
+
+    # 🧩 reduce: merge themes and deduplicate terms
+    def valid_theme(response_data):
+        if not isinstance(response_data.get('theme'), str) or not response_data['theme'].strip():
+            return {"status": "error", "message": "Missing required key: `theme`"}
+        return {"status": "success", "message": "Theme merged"}
+
+    themes = [summary.get('theme', '') for summary in summaries if summary.get('theme')]
+    if len(themes) > 1:
+        theme = ask_gpt(get_theme_merge_prompt(themes), resp_type='json', valid_def=valid_theme, log_title='summary')['theme']
+    else:
+        theme = themes[0] if themes else ''
+    terms = merge_terms([summary['terms'] for summary in summaries], exclude_srcs=[term['src'] for term in custom_terms_json['terms']])
+    summary = {'theme': theme, 'terms': terms + custom_terms_json['terms']}
+    wall_time = time.time() - start_time
+    serial_time = sum(elapsed for _, elapsed in window_results)
+    rprint(f"⏱️ Summarized {len(windows)} windows in {wall_time:.1f}s wall time, {serial_time:.1f}s if requested one by one, kept the top {len(terms)} terms")
     
     with open(_4_1_TERMINOLOGY, 'w', encoding='utf-8') as f:
         json.dump(summary, f, ensure_ascii=False, indent=4)
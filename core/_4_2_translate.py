@@ -1,98 +1,291 @@
+import os
 import pandas as pd
 import json
+import time
 import concurrent.futures
-from core.translate_lines import translate_lines
-from core._4_1_summarize import search_things_to_note_in_prompt
-from core._8_1_audio_task import check_len_then_trim
+from collections import Counter, deque
+from core.prompts import generate_shared_prompt
+from core.translate_lines import translate_faithfully, translate_expressively, faith_to_translation, origin_similarity, ORIGIN_MIN_SIMILARITY
+from core._4_1_summarize import search_things_to_note_in_prompt, load_term_index
+from core._8_1_audio_task import trim_long_subtitles
 from core._6_gen_sub import align_timestamp
 from core.utils import *
+from core.utils.ask_gpt import REQUEST_STATS
+from core.utils.translation_memory import TranslationMemory, glossary_version
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
-from difflib import SequenceMatcher
+from rich.table import Table
 from core.utils.models import *
 console = Console()
 
 # Function to split text into chunks
-def split_chunks_by_chars(chunk_size, max_i): 
-    """Split text into chunks based on character count, return a list of multi-line text chunks"""
+def split_chunks_by_tokens(max_tokens, max_i):
+    """Split text into chunks on sentence boundaries by estimated token count, return a list of multi-line text chunks"""
     with open(_3_2_SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
         sentences = file.read().strip().split('\n')
 
     chunks = []
     chunk = ''
+    chunk_tokens = 0
     sentence_count = 0
     for sentence in sentences:
-        if len(chunk) + len(sentence + '\n') > chunk_size or sentence_count == max_i:
+        sentence_tokens = estimate_tokens(sentence)
+        if (chunk and chunk_tokens + sentence_tokens > max_tokens) or sentence_count == max_i:
             chunks.append(chunk.strip())
             chunk = sentence + '\n'
+            chunk_tokens = sentence_tokens
             sentence_count = 1
         else:
             chunk += sentence + '\n'
+            chunk_tokens += sentence_tokens
             sentence_count += 1
     chunks.append(chunk.strip())
     return chunks
 
+# 📐 Chunk planner
+PROMPT_OVERHEAD_TOKENS = 1500  # instructions, theme, terminology and surrounding context of one request
+OUTPUT_TOKEN_FACTOR = 5  # the expressiveness answer echoes origin and direct, then adds reflect and free
+MIN_CHUNK_TOKENS = 40
+
+CJK_TOKENS_PER_CHAR = 0.5  # sources above this estimated token / character ratio are mostly CJK (~1 token per character)
+
+def chunk_budget_key():
+    """Configured budget and tuning key of this source: CJK text costs ~4x more estimated tokens per character
+    than space-separated text, so each script has its own budget, tuned per model"""
+    with open(_3_2_SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
+        text = file.read()
+    script = 'cjk' if text and estimate_tokens(text) / len(text) > CJK_TOKENS_PER_CHAR else 'default'
+    budget_key = 'max_tokens_cjk' if script == 'cjk' else 'max_tokens'
+    return load_key(f"translate_chunk.{budget_key}"), f"{load_key('api.model')}|{script}"
+
+def load_chunk_stats():
+    if not os.path.exists(_TRANSLATE_CHUNK_STATS):
+        return {}
+    with open(_TRANSLATE_CHUNK_STATS, 'r', encoding='utf-8') as file:
+        return {key: value for key, value in json.load(file).items() if isinstance(value, dict)}
+
+def plan_chunk_tokens():
+    """Token budget of a chunk: the tuned value from previous runs, capped so that prompt and answer fit in the context window"""
+    chunk_set = load_key("translate_chunk")
+    tokens, stats_key = chunk_budget_key()
+    if chunk_set['adaptive']:
+        tokens = load_chunk_stats().get(stats_key, {}).get('tokens', tokens)
+    context_cap = (chunk_set['context_window'] - PROMPT_OVERHEAD_TOKENS) // (1 + OUTPUT_TOKEN_FACTOR)
+    return max(MIN_CHUNK_TOKENS, min(tokens, context_cap)), chunk_set['max_lines']
+
+def snapshot_translate_stats():
+    return {step: Counter(REQUEST_STATS[f'translate_{step}']) for step in ('faithfulness', 'expressiveness')}
+
+def retune_chunk_tokens(tokens, stats_before):
+    """Shrink chunks when this run saw many invalid answers, grow them back slowly when it saw none"""
+    chunk_set = load_key("translate_chunk")
+    stats = [stat - stats_before[step] for step, stat in snapshot_translate_stats().items()]
+    requests = sum(stat['requests'] for stat in stats)
+    failures = sum(stat['failures'] for stat in stats)
+    if not chunk_set['adaptive'] or requests == 0:  # everything came from cache, nothing learned
+        return
+    failure_rate = failures / requests
+    if failure_rate > 0.1:
+        new_tokens = tokens * 0.8
+    elif failure_rate < 0.02:
+        new_tokens = tokens * 1.1
+    else:
+        new_tokens = tokens
+    base_tokens, stats_key = chunk_budget_key()
+    new_tokens = int(max(MIN_CHUNK_TOKENS, min(new_tokens, base_tokens * 2)))
+    chunk_stats = load_chunk_stats()
+    chunk_stats[stats_key] = {'tokens': new_tokens, 'last_failure_rate': round(failure_rate, 3), 'last_requests': requests}
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    with open(_TRANSLATE_CHUNK_STATS, 'w', encoding='utf-8') as file:
+        json.dump(chunk_stats, file, ensure_ascii=False, indent=4)
+    console.print(f"[cyan]📐 Chunk failure rate {failure_rate:.1%} over {requests} requests, next chunk budget of `{stats_key}` {new_tokens} tokens[/cyan]")
+
 # Get context from surrounding chunks
 def get_previous_content(chunks, chunk_index):
     return None if chunk_index == 0 else chunks[chunk_index - 1].split('\n')[-3:] # Get last 3 lines
 def get_after_content(chunks, chunk_index):
     return None if chunk_index == len(chunks) - 1 else chunks[chunk_index + 1].split('\n')[:2] # Get first 2 lines
 
-# 🔍 Translate a single chunk
-def translate_chunk(chunk, chunks, theme_prompt, i):
+# 🔍 Build the shared prompt of a single chunk
+def get_chunk_shared_prompt(chunk, chunks, theme_prompt, i):
     things_to_note_prompt = search_things_to_note_in_prompt(chunk)
     previous_content_prompt = get_previous_content(chunks, i)
     after_content_prompt = get_after_content(chunks, i)
-    translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i)
-    return i, english_result, translation
+    return generate_shared_prompt(previous_content_prompt, after_content_prompt, theme_prompt, things_to_note_prompt)
+
+def timed(func, *args):
+    start_time = time.time()
+    result = func(*args)
+    return result, time.time() - start_time
+
+# ⛓️ Run faithfulness and expressiveness as two pipeline stages under one concurrency limit
+def run_translation_pipeline(chunks, theme_prompt, max_workers, on_chunk_done=None, indices=None):
+    """Expressiveness of finished chunks is scheduled before faithfulness of new ones, so chunk N's second
+    step runs while chunk N+1's first step is in flight. Returns ({i: (origin, translation)}, latencies)."""
+    reflect_translate = load_key('reflect_translate')
+    faith_queue = deque(range(len(chunks)) if indices is None else indices)
+    express_queue = deque()
+    shared_prompts, results = {}, {}
+    latencies = {'faithfulness': [], 'expressiveness': []}
+    in_flight = {}
 
-# Add similarity calculation function
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
+    def faith_step(i):
+        shared_prompts[i] = get_chunk_shared_prompt(chunks[i], chunks, theme_prompt, i)
+        return translate_faithfully(chunks[i], shared_prompts[i], i)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while faith_queue or express_queue or in_flight:
+            while len(in_flight) < max_workers and (express_queue or faith_queue):
+                if express_queue:
+                    i, faith_result = express_queue.popleft()
+                    future = executor.submit(timed, translate_expressively, chunks[i], faith_result, shared_prompts[i], i)
+                    in_flight[future] = ('expressiveness', i, faith_result)
+                else:
+                    i = faith_queue.popleft()
+                    future = executor.submit(timed, faith_step, i)
+                    in_flight[future] = ('faithfulness', i, None)
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                step, i, faith_result = in_flight.pop(future)
+                result, elapsed = future.result()
+                latencies[step].append(elapsed)
+                if step == 'faithfulness':
+                    faith_result = result
+                    if reflect_translate:
+                        express_queue.append((i, faith_result))
+                        continue
+                    result = faith_to_translation(faith_result)
+                origin = '\n'.join(str(faith_result[key].get('origin', '')) for key in faith_result)
+                results[i] = (origin, result)
+                if on_chunk_done:
+                    on_chunk_done()
+    return results, latencies
+
+def print_latency_report(latencies, wall_time, max_workers):
+    """Per-step latency histogram, and the end-to-end speed-up over running every request one by one"""
+    buckets = [0, 5, 10, 20, 40, 80]
+    table = Table(title="⏱️ Translation latency per step")
+    table.add_column("Step", style="cyan")
+    for low, high in zip(buckets, buckets[1:] + [None]):
+        table.add_column(f"{low}-{high}s" if high else f">{low}s", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p90", justify="right")
+    for step, values in latencies.items():
+        if not values:
+            continue
+        counts = [sum(1 for v in values if low <= v < (high or float('inf'))) for low, high in zip(buckets, buckets[1:] + [None])]
+        ordered = sorted(values)
+        p50, p90 = ordered[int(0.5 * (len(ordered) - 1))], ordered[int(0.9 * (len(ordered) - 1))]
+        table.add_row(step, *map(str, counts), f"{p50:.1f}s", f"{p90:.1f}s")
+    console.print(table)
+    serial_time = sum(sum(values) for values in latencies.values())
+    console.print(f"[cyan]⏱️ Translated in {wall_time:.1f}s with max_workers={max_workers}, "
+                  f"{serial_time:.1f}s of requests in total, speed-up x{serial_time / max(wall_time, 1e-6):.2f}[/cyan]")
+
+def print_input_token_report(stats_before):
+    """Input tokens of this video, and how many of them the stable prompt prefix lets the provider cache"""
+    table = Table(title="📦 Translation input tokens")
+    for column in ("Step", "Requests", "Input tokens", "Cacheable prefix", "Uncached (est.)", "Provider cached"):
+        table.add_column(column, justify="right" if column != "Step" else "left", style="cyan" if column == "Step" else None)
+    for step, stat in snapshot_translate_stats().items():
+        stat = stat - stats_before[step]
+        if not stat['requests']:
+            continue
+        # the first request of a step writes the prefix to the cache, later ones can read it
+        uncached = stat['input_tokens'] - stat['prefix_tokens'] * (stat['requests'] - 1) / stat['requests']
+        provider = f"{stat['usage_cached_tokens']}/{stat['usage_prompt_tokens']}" if stat['usage_prompt_tokens'] else "-"
+        table.add_row(step, str(stat['requests']), str(stat['input_tokens']), str(stat['prefix_tokens']), f"{uncached:.0f}", provider)
+    console.print(table)
+
+# 🧠 Translation memory
+def get_line_glossary(line):
+    """Glossary version of a line: the terminology entries that apply to it"""
+    index = load_term_index()
+    return glossary_version([index.terms[i] for i in index.search(line)])
+
+def open_translation_memory():
+    tm_set = load_key("translation_memory")
+    if not tm_set['enabled']:
+        return None
+    return TranslationMemory(_TRANSLATION_MEMORY, load_key("target_language"), tm_set['near_threshold'])
+
+def lookup_translation_memory(tm, chunks):
+    """Return {i: (chunk, translation)} for the chunks whose lines are all remembered, and hit counts"""
+    covered, hits = {}, Counter()
+    for i, chunk in enumerate(chunks):
+        translations = []
+        for line in chunk.split('\n'):
+            translation, kind = tm.lookup(line, get_line_glossary(line))
+            hits[kind or 'miss'] += 1
+            translations.append(translation)
+        if all(translation is not None for translation in translations):
+            covered[i] = (chunk, '\n'.join(translations))
+    return covered, hits
+
+def update_translation_memory(tm, chunks, results):
+    """Remember the translated lines, chunks whose line count does not match their source are skipped
+    since their lines cannot be paired"""
+    for i, (_, translation) in results.items():
+        chunk_lines, trans_lines = chunks[i].split('\n'), translation.split('\n')
+        if len(trans_lines) != len(chunk_lines):
+            continue
+        for line, trans_line in zip(chunk_lines, trans_lines):
+            tm.add(line, get_line_glossary(line), trans_line)
+    tm.save()
 
 # 🚀 Main function to translate all chunks
 @check_file_exists(_4_2_TRANSLATION)
 def translate_all():
     console.print("[bold green]Start Translating All...[/bold green]")
-    chunks = split_chunks_by_chars(chunk_size=600, max_i=10)
+    chunk_tokens, max_lines = plan_chunk_tokens()
+    chunks = split_chunks_by_tokens(chunk_tokens, max_lines)
+    console.print(f"[cyan]📐 {len(chunks)} chunks of up to {chunk_tokens} tokens / {max_lines} lines[/cyan]")
     with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
         theme_prompt = json.load(file).get('theme')
 
-    # 🔄 Use concurrent execution for translation
+    # 🧠 Chunks fully covered by the translation memory skip the LLM
+    tm = open_translation_memory()
+    remembered = {}
+    if tm:
+        remembered, hits = lookup_translation_memory(tm, chunks)
+        total_lines = sum(hits.values())
+        console.print(f"[cyan]🧠 Translation memory: {hits['exact'] + hits['near']}/{total_lines} lines hit "
+                      f"({hits['exact']} exact, {hits['near']} near), {len(remembered)}/{len(chunks)} chunks skip the LLM[/cyan]")
+    to_translate = [i for i in range(len(chunks)) if i not in remembered]
+
+    # 🔄 Use a two-stage pipeline for translation
+    max_workers = load_key("max_workers")
+    stats_before = snapshot_translate_stats()
+    start_time = time.time()
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as progress:
-        task = progress.add_task("[cyan]Translating chunks...", total=len(chunks))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-            futures = []
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(translate_chunk, chunk, chunks, theme_prompt, i)
-                futures.append(future)
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress.update(task, advance=1)
-
-    results.sort(key=lambda x: x[0])  # Sort results based on original order
+        task = progress.add_task("[cyan]Translating chunks...", total=len(to_translate))
+        results, latencies = run_translation_pipeline(chunks, theme_prompt, max_workers, on_chunk_done=lambda: progress.update(task, advance=1), indices=to_translate)
+    print_latency_report(latencies, time.time() - start_time, max_workers)
+    print_input_token_report(stats_before)
+    retune_chunk_tokens(chunk_tokens, stats_before)
+    if tm:
+        update_translation_memory(tm, chunks, results)
+    results.update(remembered)
     
-    # 💾 Save results to lists and Excel file
+    # 💾 Save results to lists and Excel file, keyed by chunk index
     src_text, trans_text = [], []
     for i, chunk in enumerate(chunks):
         chunk_lines = chunk.split('\n')
         src_text.extend(chunk_lines)
         
-        # Calculate similarity between current chunk and translation results
-        chunk_text = ''.join(chunk_lines).lower()
-        matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) 
-                          for r in results]
-        best_match = max(matching_results, key=lambda x: x[1])
-        
-        # Check similarity and handle exceptions
-        if best_match[1] < 0.9:
-            console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
+        # Integrity check: the echoed source must match the chunk line by line and the line count must be kept,
+        # chunks from the translation memory are their own source
+        origin, translation = results[i]
+        trans_lines = translation.split('\n')
+        similarity = origin_similarity(origin, chunk)
+        if similarity < ORIGIN_MIN_SIMILARITY or len(trans_lines) != len(chunk_lines):
+            console.print(f"[yellow]Warning: Translation of chunk {i} does not match its source "
+                          f"(similarity: {similarity:.3f}, lines: {len(trans_lines)}/{len(chunk_lines)})[/yellow]")
             raise ValueError(f"Translation matching failed (chunk {i})")
-        elif best_match[1] < 1.0:
-            console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
+        elif similarity < 1.0:
+            console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {similarity:.3f})[/yellow]")
             
-        trans_text.extend(best_match[0][2].split('\n'))
+        trans_text.extend(trans_lines)
     
     # Trim long translation text
     df_text = pd.read_excel(_2_CLEANED_CHUNKS)
@@ -101,8 +294,8 @@ def translate_all():
     subtitle_output_configs = [('trans_subs_for_audio.srt', ['Translation'])]
     df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
     console.print(df_time)
-    # apply check_len_then_trim to df_time['Translation'], only when duration > MIN_TRIM_DURATION.
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    # shorten the translations that cannot be read within their duration, only when duration > MIN_TRIM_DURATION.
+    df_time['Translation'] = trim_long_subtitles(df_time['Translation'].tolist(), df_time['duration'].to_numpy())
     console.print(df_time)
     
     df_time.to_excel(_4_2_TRANSLATION, index=False)
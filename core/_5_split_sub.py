@@ -1,3 +1,6 @@
+import sys
+import time
+import numpy as np
 import pandas as pd
 from typing import List, Tuple
 import concurrent.futures
@@ -13,22 +16,52 @@ console = Console()
 
 # ! You can modify your own weights here
 # Chinese and Japanese 2.5 characters, Korean 2 characters, Thai 1.5 characters, full-width symbols 2 characters, other English-based and half-width symbols 1 character
+CHAR_WEIGHT_RANGES = [
+    (0x4E00, 0x9FFF, 1.75), (0x3040, 0x30FF, 1.75),  # Chinese and Japanese
+    (0xAC00, 0xD7A3, 1.5), (0x1100, 0x11FF, 1.5),  # Korean
+    (0x0E00, 0x0E7F, 1),  # Thai
+    (0xFF01, 0xFF5E, 1.75),  # full-width symbols
+]
+# weight of every BMP code point, other characters (e.g. English and half-width symbols) weigh 1
+_CHAR_WEIGHTS = np.ones(0x10000, dtype=np.float64)
+for _start, _end, _weight in CHAR_WEIGHT_RANGES:
+    _CHAR_WEIGHTS[_start:_end + 1] = _weight
+
+def _char_weights(text: str) -> np.ndarray:
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    # code points beyond the BMP weigh 1 like every unlisted character
+    return np.where(codes < 0x10000, _CHAR_WEIGHTS[np.minimum(codes, 0xFFFF)], 1.0)
+
 def calc_len(text: str) -> float:
     text = str(text) # force convert
-    def char_weight(char):
-        code = ord(char)
-        if 0x4E00 <= code <= 0x9FFF or 0x3040 <= code <= 0x30FF:  # Chinese and Japanese
-            return 1.75
-        elif 0xAC00 <= code <= 0xD7A3 or 0x1100 <= code <= 0x11FF:  # Korean
-            return 1.5
-        elif 0x0E00 <= code <= 0x0E7F:  # Thai
-            return 1
-        elif 0xFF01 <= code <= 0xFF5E:  # full-width symbols
-            return 1.75
-        else:  # other characters (e.g. English and half-width symbols)
-            return 1
-
-    return sum(char_weight(char) for char in text)
+    return float(_char_weights(text).sum())
+
+def calc_len_batch(texts: List[str]) -> np.ndarray:
+    """calc_len of a whole column at once: one lookup over all code points, summed per text"""
+    texts = [str(text) for text in texts]
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    result = np.zeros(len(texts), dtype=np.float64)
+    if lengths.sum() == 0:
+        return result
+    weights = _char_weights(''.join(texts))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    non_empty = lengths > 0
+    result[non_empty] = np.add.reduceat(weights, starts[non_empty])
+    return result
+
+def benchmark_calc_len(n: int = 100_000):
+    """Lines per second of calc_len per line and calc_len_batch on n mixed-script subtitle lines"""
+    samples = ["This is a fairly typical English subtitle line.", "这是一个典型的中文字幕，长度适中。",
+               "日本語の字幕もテストします", "한국어 자막도 시험합니다", "Full-width！（test）"]
+    texts = [samples[i % len(samples)] + str(i) for i in range(n)]
+    start = time.perf_counter()
+    single = [calc_len(text) for text in texts]
+    per_line = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = calc_len_batch(texts)
+    batched = time.perf_counter() - start
+    assert np.allclose(single, batch)
+    console.print(f"calc_len on {n} lines: {n / per_line:,.0f} lines/s per line, {n / batched:,.0f} lines/s batched")
 
 def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
     align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
@@ -38,6 +71,9 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
             return {"status": "error", "message": "Missing required key: `align`"}
         if len(response_data['align']) < 2:
             return {"status": "error", "message": "Align does not contain more than 1 part as expected!"}
+        src_lines = len(src_part.split('\n'))
+        if len(response_data['align']) != src_lines:
+            return {"status": "error", "message": f"Align has {len(response_data['align'])} parts, the source has {src_lines} lines"}
         return {"status": "success", "message": "Align completed"}
     parsed = ask_gpt(align_prompt, resp_type='json', valid_def=valid_align, log_title='align_subs')
     align_data = parsed['align']
@@ -58,96 +94,102 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
     
     return src_parts, tr_parts, tr_remerged
 
-def split_align_subs(src_lines: List[str], tr_lines: List[str]):
+def needs_split(flat_pieces: List[Tuple[str, str]]) -> np.ndarray:
+    """Boolean mask of the (src, tr) pieces that are over length, computed for the whole column at once"""
     subtitle_set = load_key("subtitle")
-    MAX_SUB_LENGTH = subtitle_set["max_length"]
-    TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
-    remerged_tr_lines = tr_lines.copy()
-    
-    to_split = []
-    for i, (src, tr) in enumerate(zip(src_lines, tr_lines)):
-        src, tr = str(src), str(tr)
-        if len(src) > MAX_SUB_LENGTH or calc_len(tr) * TARGET_SUB_MULTIPLIER > MAX_SUB_LENGTH:
-            to_split.append(i)
-            table = Table(title=f"📏 Line {i} needs to be split")
-            table.add_column("Type", style="cyan")
-            table.add_column("Content", style="magenta")
-            table.add_row("Source Line", src)
-            table.add_row("Target Line", tr)
-            console.print(table)
-    
-    @except_handler("Error in split_align_subs")
-    def process(i):
-        split_src = split_sentence(src_lines[i], num_parts=2).strip()
-        src_parts, tr_parts, tr_remerged = align_subs(src_lines[i], tr_lines[i], split_src)
-        src_lines[i] = src_parts
-        tr_lines[i] = tr_parts
-        remerged_tr_lines[i] = tr_remerged
-    
+    if not flat_pieces:
+        return np.zeros(0, dtype=bool)
+    src_len = np.array([len(src) for src, _ in flat_pieces])
+    tr_len = calc_len_batch([tr for _, tr in flat_pieces])
+    return (src_len > subtitle_set["max_length"]) | (tr_len * subtitle_set["target_multiplier"] > subtitle_set["max_length"])
+
+def split_align_line(src: str, tr: str, retry_attempt: int = 0) -> Tuple[List[str], List[str], str]:
+    """Split one source line in two and align its translation to the parts"""
+    split_src = split_sentence(src, num_parts=2, retry_attempt=retry_attempt).strip()
+    return align_subs(src, tr, split_src)
+
+def split_align_subs(pieces: List[List[Tuple[str, str]]], attempt: int = 0):
+    """Split every (src, tr) piece that is still over length, in place, return {line index: remerged translation}.
+
+    Identical pieces are requested once, requests run concurrently and results are merged back by
+    (line, piece) index, so the order of completion does not matter. Failed pieces stay as they are
+    and are submitted again in the next attempt."""
+    positions = [(i, j) for i, line in enumerate(pieces) for j in range(len(line))]
+    over_length = needs_split([pieces[i][j] for i, j in positions])
+    to_split = {}
+    for (i, j), over in zip(positions, over_length):
+        if not over:
+            continue
+        src, tr = pieces[i][j]
+        to_split.setdefault((src, tr), []).append((i, j))
+        table = Table(title=f"📏 Line {i} needs to be split")
+        table.add_column("Type", style="cyan")
+        table.add_column("Content", style="magenta")
+        table.add_row("Source Line", src)
+        table.add_row("Target Line", tr)
+        console.print(table)
+
+    results, errors = {}, {}
     with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-        executor.map(process, to_split)
-    
-    # Flatten `src_lines` and `tr_lines`
-    src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
-    tr_lines = [item for sublist in tr_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
-    
-    return src_lines, tr_lines, remerged_tr_lines
+        futures = {executor.submit(split_align_line, src, tr, attempt): (src, tr) for src, tr in to_split}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+
+    for (src, tr), e in errors.items():
+        console.print(f"[red]❌ Error in split_align_subs for line {to_split[(src, tr)][0][0]}: {e}[/red]")
+
+    # merge by index: replace every split piece with its parts, keeping the line order
+    replaced, remerged = {}, {}
+    for key, positions in to_split.items():
+        if key not in results:
+            continue
+        src_parts, tr_parts, tr_remerged = results[key]
+        assert len(src_parts) == len(tr_parts), f"{len(src_parts)} source parts but {len(tr_parts)} translated parts"
+        for i, j in positions:
+            replaced[(i, j)] = list(zip(src_parts, tr_parts))
+            if len(pieces[i]) == 1:
+                remerged[i] = tr_remerged
+    for i, line in enumerate(pieces):
+        if any((i, j) in replaced for j in range(len(line))):
+            pieces[i] = [part for j, piece in enumerate(line) for part in replaced.get((i, j), [piece])]
+    return remerged, len(to_split), len(errors)
 
 def split_for_sub_main():
     console.print("[bold green]🚀 Start splitting subtitles...[/bold green]")
     
     df = pd.read_excel(_4_2_TRANSLATION)
-    src = df['Source'].tolist()
-    trans = df['Translation'].tolist()
+    src = df['Source'].fillna('').astype(str).tolist()
+    trans = df['Translation'].fillna('').astype(str).tolist()
     
-    # Keep track of original data for remerged file
-    original_src = src.copy()
-    original_trans = trans.copy()
-    
-    subtitle_set = load_key("subtitle")
-    MAX_SUB_LENGTH = subtitle_set["max_length"]
-    TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
-    
-    # Track remerged data for each iteration
-    final_remerged = original_trans.copy()
+    # every original line holds its list of (src, tr) pieces, split pieces are replaced by their parts
+    pieces = [[(s, t)] for s, t in zip(src, trans)]
+    # remerged translation per original line, from the first split of the line
+    final_remerged = trans.copy()
     
     for attempt in range(3):  # 使用固定的3次重试
         console.print(Panel(f"🔄 Split attempt {attempt + 1}", expand=False))
-        
-        # Debug: print lengths before split
-        console.print(f"[yellow]Debug: src length={len(src)}, trans length={len(trans)}[/yellow]")
-        
-        split_src, split_trans, remerged = split_align_subs(src.copy(), trans)
-        
-        # Debug: print lengths after split
-        console.print(f"[yellow]Debug: split_src length={len(split_src)}, split_trans length={len(split_trans)}, remerged length={len(remerged)}[/yellow]")
-        
-        # Only update final_remerged in the first iteration (when we still have original structure)
-        if attempt == 0:
-            final_remerged = remerged.copy()
+        remerged, submitted, failed = split_align_subs(pieces, attempt)
+        for i, tr_remerged in remerged.items():
+            final_remerged[i] = tr_remerged
+        console.print(f"[yellow]Split attempt {attempt + 1}: {submitted} unique pieces submitted, {failed} failed[/yellow]")
         
         # 检查是否所有字幕都符合长度要求
-        if all(len(src) <= MAX_SUB_LENGTH for src in split_src) and \
-           all(calc_len(tr) * TARGET_SUB_MULTIPLIER <= MAX_SUB_LENGTH for tr in split_trans):
+        if submitted == 0 or not needs_split([piece for line in pieces for piece in line]).any():
             break
-        
-        # 更新源数据继续下一轮分割
-        src, trans = split_src, split_trans
-
-    # 确保二者有相同的长度，防止报错
-    if len(src) > len(remerged):
-        remerged += [None] * (len(src) - len(remerged))
-    elif len(remerged) > len(src):
-        src += [None] * (len(remerged) - len(src))
+
+    # deterministic flattening, in line order then piece order
+    split_src = [s for line in pieces for s, _ in line]
+    split_trans = [t for line in pieces for _, t in line]
+    console.print(f"[yellow]{len(src)} lines split into {len(split_src)} subtitles[/yellow]")
     
     pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(_5_SPLIT_SUB, index=False)
-    pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(_5_REMERGED, index=False)
-
-    # Debug: print final lengths
-    console.print(f"[yellow]Debug: original_src length={len(original_src)}, final_remerged length={len(final_remerged)}[/yellow]")
-
-    pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(OUTPUT_SPLIT_FILE, index=False)
-    pd.DataFrame({'Source': original_src, 'Translation': final_remerged}).to_excel(OUTPUT_REMERGED_FILE, index=False)
+    pd.DataFrame({'Source': src, 'Translation': final_remerged}).to_excel(_5_REMERGED, index=False)
 
 if __name__ == '__main__':
-    split_for_sub_main()
+    if sys.argv[1:] == ['benchmark']:
+        benchmark_calc_len()
+    else:
+        split_for_sub_main()
@@ -1,11 +1,16 @@
 import pandas as pd
+import numpy as np
 import os
 import re
+import json
+import hashlib
+from difflib import SequenceMatcher
 from rich.panel import Panel
 from rich.console import Console
 import autocorrect_py as autocorrect
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_io import format_timestamps, write_subtitle_variants
 console = Console()
 
 SUBTITLE_OUTPUT_CONFIGS = [ 
@@ -20,19 +25,6 @@ AUDIO_SUBTITLE_OUTPUT_CONFIGS = [
     ('trans_subs_for_audio.srt', ['Translation'])
 ]
 
-def convert_to_srt_format(start_time, end_time):
-    """Convert time (in seconds) to the format: hours:minutes:seconds,milliseconds"""
-    def seconds_to_hmsm(seconds):
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        milliseconds = int(seconds * 1000) % 1000
-        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
-
-    start_srt = seconds_to_hmsm(start_time)
-    end_srt = seconds_to_hmsm(end_time)
-    return f"{start_srt} --> {end_srt}"
-
 def remove_punctuation(text):
     text = re.sub(r'\s+', ' ', text)
     text = re.sub(r'[^\w\s]', '', text)
@@ -56,87 +48,158 @@ def show_difference(str1, str2):
     print("Position markers: " + "".join("^" if i in diff_positions else " " for i in range(max(len(str1), len(str2)))))
     print(f"Difference indices: {diff_positions}")
 
+MIN_RECOVER_RATIO = 0.6  # share of a sentence's characters that must match to recover it from a fuzzy match
+
+def recover_sentence_span(full_words_str, clean_sentence, current_pos):
+    """Locate a sentence that has no exact match in a window after `current_pos`, tolerating small ASR/punctuation
+    differences. Return (start, end) character positions, or None when too little of the sentence matches."""
+    sentence_len = len(clean_sentence)
+    window = full_words_str[current_pos:current_pos + 2 * sentence_len + 20]
+    blocks = [b for b in SequenceMatcher(None, clean_sentence, window, autojunk=False).get_matching_blocks() if b.size]
+    if not blocks or sum(b.size for b in blocks) < MIN_RECOVER_RATIO * sentence_len:
+        return None
+    # extend the matched blocks by the unmatched head and tail of the sentence
+    start = max(0, blocks[0].b - blocks[0].a)
+    end = min(len(window), blocks[-1].b + blocks[-1].size + (sentence_len - blocks[-1].a - blocks[-1].size))
+    return current_pos + start, current_pos + max(end, start + 1)
+
 def get_sentence_timestamps(df_words, df_sentences):
-    time_stamp_list = []
-    
-    # Build complete string and position mapping
-    full_words_str = ''
-    position_to_word_idx = {}
-    
-    for idx, word in enumerate(df_words['text']):
-        clean_word = remove_punctuation(word.lower())
-        start_pos = len(full_words_str)
-        full_words_str += clean_word
-        for pos in range(start_pos, len(full_words_str)):
-            position_to_word_idx[pos] = idx
-    
+    # Build complete string and the end offset of every word, positions map to words by binary search
+    clean_words = [remove_punctuation(word.lower()) for word in df_words['text']]
+    full_words_str = ''.join(clean_words)
+    word_ends = np.cumsum([len(word) for word in clean_words])
+    starts = df_words['start'].to_numpy(dtype=float)
+    ends = df_words['end'].to_numpy(dtype=float)
+
+    spans = []
     current_pos = 0
+    recovered = 0
     for idx, sentence in df_sentences['Source'].items():
         clean_sentence = remove_punctuation(sentence.lower()).replace(" ", "")
         sentence_len = len(clean_sentence)
         
-        match_found = False
-        while current_pos <= len(full_words_str) - sentence_len:
-            if full_words_str[current_pos:current_pos+sentence_len] == clean_sentence:
-                start_word_idx = position_to_word_idx[current_pos]
-                end_word_idx = position_to_word_idx[current_pos + sentence_len - 1]
-                
-                time_stamp_list.append((
-                    float(df_words['start'][start_word_idx]),
-                    float(df_words['end'][end_word_idx])
-                ))
-                
-                current_pos += sentence_len
-                match_found = True
-                break
-            current_pos += 1
-            
-        if not match_found:
-            print(f"\n⚠️ Warning: No exact match found for sentence: {sentence}")
-            show_difference(clean_sentence, 
-                          full_words_str[current_pos:current_pos+len(clean_sentence)])
-            print("\nOriginal sentence:", df_sentences['Source'][idx])
-            raise ValueError("❎ No match found for sentence.")
+        if not sentence_len:
+            # nothing left after removing punctuation (e.g. "-"), merged into a neighbour below
+            spans.append(None)
+            continue
+        match_pos = full_words_str.find(clean_sentence, current_pos)
+        if match_pos != -1:
+            span = (match_pos, match_pos + sentence_len)
+        else:
+            span = recover_sentence_span(full_words_str, clean_sentence, current_pos)
+            if span is None:
+                print(f"\n⚠️ Warning: No exact match found for sentence: {sentence}")
+                show_difference(clean_sentence, 
+                              full_words_str[current_pos:current_pos+len(clean_sentence)])
+                print("\nOriginal sentence:", df_sentences['Source'][idx])
+                raise ValueError("❎ No match found for sentence.")
+            recovered += 1
+            console.print(f"[yellow]⚠️ No exact match for sentence {idx}, aligned to the closest words: "
+                          f"{sentence} → {full_words_str[span[0]:span[1]]}[/yellow]")
+
+        spans.append(span)
+        current_pos = span[1]
     
+    if recovered:
+        console.print(f"[yellow]⚠️ {recovered} sentences were aligned without an exact match[/yellow]")
+    # sentences without words take the span of the previous sentence, or of the next one at the start
+    empty = [i for i, span in enumerate(spans) if span is None]
+    if empty:
+        matched = [span for span in spans if span is not None] or [(0, 1)]
+        previous = None
+        for i, span in enumerate(spans):
+            spans[i] = previous = span or previous
+        spans = [span or matched[0] for span in spans]
+        console.print(f"[yellow]⚠️ {len(empty)} sentences have no words after removing punctuation and share "
+                      f"the timing of a neighbour: {', '.join(str(df_sentences['Source'].iloc[i]) for i in empty)}[/yellow]")
+    # map the first and last character of every span to its word in one pass
+    spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+    start_idx = np.minimum(np.searchsorted(word_ends, spans[:, 0], side='right'), len(word_ends) - 1)
+    end_idx = np.minimum(np.searchsorted(word_ends, spans[:, 1] - 1, side='right'), len(word_ends) - 1)
+    time_stamp_list = list(zip(starts[start_idx].tolist(), ends[end_idx].tolist()))
     return time_stamp_list
 
+CUE_DTYPE = np.dtype([('start', 'f8'), ('end', 'f8'), ('duration', 'f8')])
+
+def postprocess_timeline(starts, ends, max_gap=1.0, min_duration=0.0, fix_overlaps=False):
+    """Timing post-processing over whole arrays, return a cue table of CUE_DTYPE.
+
+    `duration` is the aligned speech duration, before any adjustment. Gaps shorter than `max_gap`
+    are closed by extending a cue to the next start. Cues shorter than `min_duration` are extended
+    without running into the next cue, and with `fix_overlaps` a cue ends at the latest when the
+    next one starts."""
+    cues = np.zeros(len(starts), dtype=CUE_DTYPE)
+    cues['start'] = starts
+    cues['end'] = ends
+    cues['duration'] = cues['end'] - cues['start']
+    if len(cues) < 2:
+        return cues
+
+    # Remove gaps 🕳️, every cue only looks at the next start, so all cues can be closed at once
+    next_start = cues['start'][1:]
+    gap = next_start - cues['end'][:-1]
+    cues['end'][:-1] = np.where((gap > 0) & (gap < max_gap), next_start, cues['end'][:-1])
+
+    if min_duration > 0:
+        extended = np.maximum(cues['end'], cues['start'] + min_duration)
+        extended[:-1] = np.minimum(extended[:-1], np.maximum(next_start, cues['end'][:-1]))
+        cues['end'] = extended
+    if fix_overlaps:
+        cues['end'][:-1] = np.minimum(cues['end'][:-1], np.maximum(next_start, cues['start'][:-1]))
+    return cues
+
+def get_timeline(df_text, sources):
+    """Aligned timeline of `sources`, computed once per video and cached in _6_ALIGNED_TIMELINE.
+
+    `translate_all` aligns the translated lines, the remerged audio subtitles reuse that timeline."""
+    sources = [str(source) for source in sources]
+    digest = hashlib.md5()
+    digest.update('\x00'.join(df_text['text'].astype(str)).encode('utf-8'))
+    digest.update(df_text[['start', 'end']].to_numpy(dtype=float).tobytes())
+    digest.update('\x00'.join(sources).encode('utf-8'))
+    key = digest.hexdigest()
+
+    cache = {}
+    if os.path.exists(_6_ALIGNED_TIMELINE):
+        with open(_6_ALIGNED_TIMELINE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    if key in cache:
+        console.print(f"[cyan]♻️ Reusing the aligned timeline of {len(sources)} lines[/cyan]")
+        return cache[key]['start'], cache[key]['end']
+
+    time_stamp_list = get_sentence_timestamps(df_text, pd.DataFrame({'Source': sources}))
+    cache[key] = {'start': [x[0] for x in time_stamp_list], 'end': [x[1] for x in time_stamp_list]}
+    os.makedirs(os.path.dirname(_6_ALIGNED_TIMELINE), exist_ok=True)
+    with open(_6_ALIGNED_TIMELINE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    return cache[key]['start'], cache[key]['end']
+
 def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True):
     """Align timestamps and add a new timestamp column to df_translate"""
     df_trans_time = df_translate.copy()
 
-    # Assign an ID to each word in df_text['text'] and create a new DataFrame
-    words = df_text['text'].str.split(expand=True).stack().reset_index(level=1, drop=True).reset_index()
-    words.columns = ['id', 'word']
-    words['id'] = words['id'].astype(int)
-
     # Process timestamps ⏰
-    time_stamp_list = get_sentence_timestamps(df_text, df_translate)
-    df_trans_time['timestamp'] = time_stamp_list
-    df_trans_time['duration'] = df_trans_time['timestamp'].apply(lambda x: x[1] - x[0])
-
-    # Remove gaps 🕳️
-    for i in range(len(df_trans_time)-1):
-        delta_time = df_trans_time.loc[i+1, 'timestamp'][0] - df_trans_time.loc[i, 'timestamp'][1]
-        if 0 < delta_time < 1:
-            df_trans_time.at[i, 'timestamp'] = (df_trans_time.loc[i, 'timestamp'][0], df_trans_time.loc[i+1, 'timestamp'][0])
+    cues = postprocess_timeline(*get_timeline(df_text, df_translate['Source']))
 
     # Convert start and end timestamps to SRT format
-    df_trans_time['timestamp'] = df_trans_time['timestamp'].apply(lambda x: convert_to_srt_format(x[0], x[1]))
+    starts, ends = cues['start'], cues['end']
+    df_trans_time['timestamp'] = [f"{s} --> {e}" for s, e in zip(format_timestamps(starts), format_timestamps(ends))]
+    df_trans_time['duration'] = cues['duration']
 
     # Polish subtitles: replace punctuation in Translation if for_display
     if for_display:
         df_trans_time['Translation'] = df_trans_time['Translation'].apply(lambda x: re.sub(r'[，。]', ' ', x).strip())
 
-    # Output subtitles 📜
-    def generate_subtitle_string(df, columns):
-        return ''.join([f"{i+1}\n{row['timestamp']}\n{row[columns[0]].strip()}\n{row[columns[1]].strip() if len(columns) > 1 else ''}\n\n" for i, row in df.iterrows()]).strip()
-
+    # Output subtitles 📜, every variant is rendered from the same timeline
     if output_dir:
-        os.makedirs(output_dir, exist_ok=True)
+        columns_text = {column: df_trans_time[column].astype(str).str.strip() for column in ('Source', 'Translation')}
+        variants = []
         for filename, columns in subtitle_output_configs:
-            subtitle_str = generate_subtitle_string(df_trans_time, columns)
-            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
-                f.write(subtitle_str)
+            texts = columns_text[columns[0]]
+            if len(columns) > 1:
+                texts = texts + '\n' + columns_text[columns[1]]
+            variants.append((os.path.join(output_dir, filename), texts.tolist()))
+        write_subtitle_variants(starts, ends, variants)
     
     return df_trans_time
 
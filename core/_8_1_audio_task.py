@@ -1,12 +1,18 @@
 import datetime
 import re
+import concurrent.futures
+import numpy as np
 import pandas as pd
 from rich.console import Console
 from rich.panel import Panel
-from core.prompts import get_subtitle_trim_prompt
-from core.tts_backend.estimate_duration import init_estimator, estimate_duration
+from rich.table import Table
+from rich import box
+from core.prompts import get_subtitle_trim_prompt, get_subtitle_trim_batch_prompt
+from core.tts_backend.estimate_duration import init_estimator, estimate_duration, estimate_duration_batch
 from core.utils import *
 from core.utils.models import *
+from core.utils.ask_gpt import record_stat
+from core.utils.subtitle_io import read_subtitles
 
 console = Console()
 speed_factor = load_key("speed_factor")
@@ -43,88 +49,173 @@ def check_len_then_trim(text, duration):
     else:
         return text
 
+def estimate_durations(texts):
+    """Estimated reading duration of every text at the maximum speed factor, as one array"""
+    global ESTIMATOR
+    if ESTIMATOR is None:
+        ESTIMATOR = init_estimator()
+    return np.array(estimate_duration_batch(texts, ESTIMATOR), dtype=float) / speed_factor['max']
+
+def trim_batch(batch):
+    """Shorten several subtitles with one GPT request, return {index: shortened_text}.
+
+    Items missing from the answer, or whose answer does not read shorter than the original, fall back
+    to one `check_len_then_trim` request each."""
+    def valid_trim_batch(response):
+        if not isinstance(response, dict) or not response:
+            return {'status': 'error', 'message': 'Response is not a JSON object'}
+        return {'status': 'success', 'message': ''}
+
+    try:
+        response = ask_gpt(get_subtitle_trim_batch_prompt([(text, duration) for _, text, duration in batch]),
+                           resp_type='json', log_title='sub_trim_batch', valid_def=valid_trim_batch)
+    except Exception as e:
+        record_stat('sub_trim_batch', 'batch_errors')
+        console.print(f"[red]❌ Batch trim request of {len(batch)} subtitles failed, trimming them one by one: {e}[/red]")
+        response = {}
+
+    answers = {}
+    for i, (index, text, duration) in enumerate(batch, 1):
+        item = response.get(str(i))
+        shortened = item.get('result') if isinstance(item, dict) else None
+        if isinstance(shortened, str) and shortened.strip():
+            answers[index] = shortened.strip()
+    # a trim is only kept when it reads shorter than the original
+    originals = {index: text for index, text, _ in batch}
+    if answers:
+        before = estimate_durations([originals[index] for index in answers])
+        after = estimate_durations(list(answers.values()))
+        for (index, shortened), old, new in zip(list(answers.items()), before, after):
+            if new >= old:
+                console.print(f"[yellow]⚠️ Rejected trim that is not shorter: {originals[index]} → {shortened}[/yellow]")
+                del answers[index]
+
+    results = {}
+    for index, text, duration in batch:
+        if index in answers:
+            results[index] = answers[index]
+        else:
+            record_stat('sub_trim_batch', 'fallback_items')
+            results[index] = check_len_then_trim(text, duration)
+    return results
+
+def trim_long_subtitles(texts, durations):
+    """Shorten every subtitle whose estimated reading duration exceeds its duration.
+
+    Durations are estimated for all rows first, the over-budget lines are then sent to the LLM in
+    concurrent batched requests and the results are merged back by position."""
+    texts = list(texts)
+    durations = np.asarray(durations, dtype=float)
+    estimated = estimate_durations(texts)
+    over = np.flatnonzero((durations > load_key("min_trim_duration")) & (estimated > durations))
+    console.print(f"[cyan]✂️ {len(over)}/{len(texts)} subtitles exceed their duration and will be shortened[/cyan]")
+    if len(over) == 0:
+        return texts
+
+    trim_set = load_key("trim_batch")
+    batch_size = trim_set['max_lines'] if trim_set['enabled'] else 1
+    items = [(int(i), texts[i], float(durations[i])) for i in over]
+    batches = [items[k:k + batch_size] for k in range(0, len(items), batch_size)]
+    trim = trim_batch if trim_set['enabled'] else (lambda batch: {index: check_len_then_trim(text, duration) for index, text, duration in batch})
+    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+        for result in executor.map(trim, batches):
+            for index, shortened in result.items():
+                texts[index] = shortened
+
+    table = Table(title="✂️ Subtitle Shortening Result", show_header=True, box=box.ROUNDED)
+    table.add_column("Duration", justify="right")
+    table.add_column("Before", style="yellow")
+    table.add_column("After", style="green")
+    for index, text, duration in items:
+        table.add_row(f"{duration:.2f}s", text, texts[index])
+    console.print(table)
+    return texts
+
 def time_diff_seconds(t1, t2, base_date):
     """Calculate the difference in seconds between two time objects"""
     dt1 = datetime.datetime.combine(base_date, t1)
     dt2 = datetime.datetime.combine(base_date, t2)
     return (dt2 - dt1).total_seconds()
 
+def format_task_times(microseconds):
+    """Integer microseconds → 'HH:MM:SS.mmm' strings, milliseconds truncated"""
+    ms = np.asarray(microseconds, dtype=np.int64) // 1000
+    hours, rest = np.divmod(ms, 3_600_000)
+    minutes, rest = np.divmod(rest, 60_000)
+    secs, millis = np.divmod(rest, 1000)
+    return [f"{h:02d}:{m:02d}:{s:02d}.{x:03d}" for h, m, s, x in zip(hours.tolist(), minutes.tolist(), secs.tolist(), millis.tolist())]
+
+def merge_short_subtitles(starts, ends, texts, origins, min_duration):
+    """Merge or extend cues shorter than `min_duration` in one forward pass, return the new cue table.
+
+    `starts` / `ends` are integer microseconds. A short cue absorbs the next one while the next starts
+    within `min_duration` of it, and is re-checked with its merged duration; otherwise it is extended to
+    `min_duration` (the last cue is left as is)."""
+    min_us = round(min_duration * 1_000_000)
+    rows = []
+    # the cue being built: [first index, start, end, duration, texts, origins]
+    current = None
+    for i in range(len(starts)):
+        if current is not None:
+            if current[3] < min_duration and (starts[i] - current[1]) / 1_000_000 < min_duration:
+                rprint(f"[bold yellow]Merging subtitles {len(rows) + 1} and {len(rows) + 2}[/bold yellow]")
+                current[2] = ends[i]
+                current[3] = (current[2] - current[1]) / 1_000_000
+                current[4].append(texts[i])
+                current[5].append(origins[i])
+                continue
+            if current[3] < min_duration:
+                rprint(f"[bold blue]Extending subtitle {len(rows) + 1} duration to {min_duration} seconds[/bold blue]")
+                current[2] = current[1] + min_us
+                current[3] = min_duration
+            rows.append(current)
+        current = [i, starts[i], ends[i], (ends[i] - starts[i]) / 1_000_000, [texts[i]], [origins[i]]]
+    if current is not None:
+        if current[3] < min_duration:
+            rprint(f"[bold red]The last subtitle {len(rows) + 1} duration is less than {min_duration} seconds, but not extending[/bold red]")
+        rows.append(current)
+
+    return {
+        'index': np.array([row[0] for row in rows], dtype=np.int64),
+        'start': np.array([row[1] for row in rows], dtype=np.int64),
+        'end': np.array([row[2] for row in rows], dtype=np.int64),
+        'duration': np.array([row[3] for row in rows], dtype=np.float64),
+        'text': [' '.join(row[4]) for row in rows],
+        'origin': [' '.join(row[5]) for row in rows],
+    }
+
 def process_srt():
     """Process srt file, generate audio tasks"""
     
-    with open(TRANS_SUBS_FOR_AUDIO_FILE, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    with open(SRC_SUBS_FOR_AUDIO_FILE, 'r', encoding='utf-8') as src_file:
-        src_content = src_file.read()
-    
-    subtitles = []
-    src_subtitles = {}
+    cues = read_subtitles(TRANS_SUBS_FOR_AUDIO_FILE)
+    src_cues = read_subtitles(SRC_SUBS_FOR_AUDIO_FILE)
+    src_subtitles = {number: text.replace('\n', ' ') for number, text in zip(src_cues.number.tolist(), src_cues.text) if text}
     
-    for block in src_content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) < 3:
-            continue
-        
-        number = int(lines[0])
-        src_text = ' '.join(lines[2:])
-        src_subtitles[number] = src_text
-    
-    for block in content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) < 3:
-            continue
-        
-        try:
-            number = int(lines[0])
-            start_time, end_time = lines[1].split(' --> ')
-            start_time = datetime.datetime.strptime(start_time, '%H:%M:%S,%f').time()
-            end_time = datetime.datetime.strptime(end_time, '%H:%M:%S,%f').time()
-            duration = time_diff_seconds(start_time, end_time, datetime.date.today())
-            text = ' '.join(lines[2:])
-            # Remove content within parentheses (including English and Chinese parentheses)
-            text = re.sub(r'\([^)]*\)', '', text).strip()
-            text = re.sub(r'（[^）]*）', '', text).strip()
-            # Remove '-' character, can continue to add illegal characters that cause errors
-            text = text.replace('-', '')
-
-            # Add the original text from src_subs_for_audio.srt
-            origin = src_subtitles.get(number, '')
-
-        except ValueError as e:
-            rprint(Panel(f"Unable to parse subtitle block '{block}', error: {str(e)}, skipping this subtitle block.", title="Error", border_style="red"))
-            continue
-        
-        subtitles.append({'number': number, 'start_time': start_time, 'end_time': end_time, 'duration': duration, 'text': text, 'origin': origin})
-    
-    df = pd.DataFrame(subtitles)
-    
-    i = 0
-    MIN_SUB_DUR = load_key("min_subtitle_duration")
-    while i < len(df):
-        today = datetime.date.today()
-        if df.loc[i, 'duration'] < MIN_SUB_DUR:
-            if i < len(df) - 1 and time_diff_seconds(df.loc[i, 'start_time'],df.loc[i+1, 'start_time'],today) < MIN_SUB_DUR:
-                rprint(f"[bold yellow]Merging subtitles {i+1} and {i+2}[/bold yellow]")
-                df.loc[i, 'text'] += ' ' + df.loc[i+1, 'text']
-                df.loc[i, 'origin'] += ' ' + df.loc[i+1, 'origin']
-                df.loc[i, 'end_time'] = df.loc[i+1, 'end_time']
-                df.loc[i, 'duration'] = time_diff_seconds(df.loc[i, 'start_time'],df.loc[i, 'end_time'],today)
-                df = df.drop(i+1).reset_index(drop=True)
-            else:
-                if i < len(df) - 1:  # Not the last audio
-                    rprint(f"[bold blue]Extending subtitle {i+1} duration to {MIN_SUB_DUR} seconds[/bold blue]")
-                    df.loc[i, 'end_time'] = (datetime.datetime.combine(today, df.loc[i, 'start_time']) + 
-                                            datetime.timedelta(seconds=MIN_SUB_DUR)).time()
-                    df.loc[i, 'duration'] = MIN_SUB_DUR
-                else:
-                    rprint(f"[bold red]The last subtitle {i+1} duration is less than {MIN_SUB_DUR} seconds, but not extending[/bold red]")
-                i += 1
-        else:
-            i += 1
-    
-    df['start_time'] = df['start_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
-    df['end_time'] = df['end_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
+    keep = np.array([bool(text) for text in cues.text], dtype=bool)
+    numbers = cues.number[keep]
+    # times at millisecond precision, held as integer microseconds so merged and extended times stay exact
+    starts = np.round(cues.start[keep] * 1000).astype(np.int64) * 1000
+    ends = np.round(cues.end[keep] * 1000).astype(np.int64) * 1000
+    texts = []
+    for text in (text for text, kept in zip(cues.text, keep) if kept):
+        text = text.replace('\n', ' ')
+        # Remove content within parentheses (including English and Chinese parentheses)
+        text = re.sub(r'\([^)]*\)', '', text).strip()
+        text = re.sub(r'（[^）]*）', '', text).strip()
+        # Remove '-' character, can continue to add illegal characters that cause errors
+        texts.append(text.replace('-', ''))
+    # Add the original text from src_subs_for_audio.srt
+    origins = [src_subtitles.get(number, '') for number in numbers.tolist()]
+
+    merged = merge_short_subtitles(starts.tolist(), ends.tolist(), texts, origins, load_key("min_subtitle_duration"))
+    df = pd.DataFrame({
+        'number': numbers[merged['index']],
+        'start_time': format_task_times(merged['start']),
+        'end_time': format_task_times(merged['end']),
+        'duration': merged['duration'],
+        'text': merged['text'],
+        'origin': merged['origin'],
+    })
 
     ##! No longer perform secondary trim
     # check and trim subtitle length, for twice to ensure the subtitle length is within the limit, 允许tolerance
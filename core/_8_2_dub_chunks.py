@@ -3,9 +3,10 @@ import re
 import pandas as pd
 from core._8_1_audio_task import time_diff_seconds
 from core.asr_backend.audio_preprocess import get_audio_duration
-from core.tts_backend.estimate_duration import init_estimator, estimate_duration
+from core.tts_backend.estimate_duration import init_estimator, estimate_duration_batch
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_io import read_subtitles
 
 SRC_SRT = "output/src.srt"
 TRANS_SRT = "output/trans.srt"
@@ -76,7 +77,7 @@ def analyze_subtitle_timing_and_speed(df):
     
     df['tolerance'] = df['gap'].apply(lambda x: TOLERANCE if x > TOLERANCE else x)
     df['tol_dur'] = df['duration'] + df['tolerance']
-    df['est_dur'] = df.apply(lambda x: estimate_duration(x['text'], ESTIMATOR), axis=1)
+    df['est_dur'] = estimate_duration_batch(df['text'].tolist(), ESTIMATOR)
 
     ## Calculate speed indicators
     accept = load_key("speed_factor.accept") # Maximum acceptable speed factor
@@ -140,28 +141,12 @@ def gen_dub_chunks():
     df = process_cutoffs(df)
 
     rprint("[📝 Reading] Loading transcript files...")
-    content = open(TRANS_SRT, "r", encoding="utf-8").read()
-    ori_content = open(SRC_SRT, "r", encoding="utf-8").read()
-    
-    # Process subtitle content
-    content_lines = []
-    ori_content_lines = []
-    
-    # Process translated subtitles
-    for block in content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            content_lines.append(text)
-            
-    # Process source subtitles (same structure)
-    for block in ori_content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            ori_content_lines.append(text)
+    def clean_cue(text):
+        return re.sub(r'\([^)]*\)|（[^）]*）', '', text.replace('\n', ' ')).strip().replace('-', '')
+
+    # Process translated and source subtitles (same structure)
+    content_lines = [clean_cue(text) for text in read_subtitles(TRANS_SRT).text if text]
+    ori_content_lines = [clean_cue(text) for text in read_subtitles(SRC_SRT).text if text]
 
     # Match processing
     df['lines'] = None
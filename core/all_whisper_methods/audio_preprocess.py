@@ -4,19 +4,13 @@ from typing import Dict, List, Tuple
 from rich import print
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from core.utils.config_utils import update_key, load_key
+from core.utils.subtitle_io import write_subtitles
 
 AUDIO_DIR = "output/audio"
 RAW_AUDIO_FILE = "output/audio/raw.mp3"
 CLEANED_CHUNKS_EXCEL_PATH = "output/log/cleaned_chunks.xlsx"
 ASR_SRT_PATH = "output/asr_only.srt"
 
-def _seconds_to_srt_ts(seconds: float) -> str:
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int(round((seconds - int(seconds)) * 1000))
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
-
 def _clean_srt_text(text: str) -> str:
     # Remove spaces between consecutive CJK characters and around CJK punctuation
     text = re.sub(r'(?<=[\u4e00-\u9FFF])\s+(?=[\u4e00-\u9FFF])', '', text)
@@ -58,13 +52,7 @@ def save_asr_srt(df: pd.DataFrame, srt_path: str = ASR_SRT_PATH):
     df_sorted = df.sort_values(by=['start', 'end']).copy()
     # build segments and write srt
     segments = _words_to_srt_segments(df_sorted)
-    lines = []
-    for i, (st_sec, en_sec, txt) in enumerate(segments, start=1):
-        start_srt = _seconds_to_srt_ts(st_sec)
-        end_srt = _seconds_to_srt_ts(en_sec)
-        lines.append(f"{i}\n{start_srt} --> {end_srt}\n{txt}\n")
-    with open(srt_path, 'w', encoding='utf-8') as f:
-        f.write("\n".join(lines).strip() + "\n")
+    write_subtitles(srt_path, [seg[0] for seg in segments], [seg[1] for seg in segments], [seg[2] for seg in segments])
     print(f"📜 SRT file saved to {srt_path}")
 
 def compress_audio(input_file: str, output_file: str):
@@ -48,6 +48,43 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
     "split": "Complete sentence with [br] tags at split positions"
 }}"""
 
+def get_split_batch_prompt(sentences, word_limit = 20):
+    """`sentences` is a list of (sentence, num_parts)"""
+    language = load_key("whisper.detected_language")
+    given_text = '\n'.join(
+        f'<sentence_{i} parts="{num_parts}">\n{sentence}\n</sentence_{i}>'
+        for i, (sentence, num_parts) in enumerate(sentences, 1)
+    )
+    json_format = json.dumps({
+        str(i): {"split": f"Sentence {i} with [br] tags at split positions"}
+        for i in range(1, len(sentences) + 1)
+    }, indent=2, ensure_ascii=False)
+    split_prompt = f"""
+## Role
+You are a professional Netflix subtitle splitter in **{language}**.
+
+## Task
+Split each of the given subtitle texts into the number of parts given in its `parts` attribute, each part less than **{word_limit}** words.
+
+1. Maintain sentence meaning coherence according to Netflix subtitle standards
+2. MOST IMPORTANT: Keep parts roughly equal in length (minimum 3 words each)
+3. Split at natural points like punctuation marks or conjunctions
+4. If provided text is repeated words, simply split at the middle of the repeated words.
+5. Never change, add or drop words, only insert [br] tags
+6. Handle every sentence independently and keep their numbering
+
+## Given Text
+{given_text}
+
+## Output in only JSON format and no other text
+```json
+{json_format}
+```
+
+Note: Start you answer with ```json and end with ```, do not add any other text.
+""".strip()
+    return split_prompt
+
 ## ================================================================
 # @ step4_1_summarize.py
 def get_summary_prompt(source_content, custom_terms_json=None):
@@ -123,25 +160,58 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 """.strip()
     return summary_prompt
 
+def get_theme_merge_prompt(themes):
+    tgt_lang = load_key("target_language")
+    themes_text = '\n'.join(f'{i}. {theme}' for i, theme in enumerate(themes, 1))
+    merge_prompt = f"""
+## Role
+You are a video translation expert, specializing in summarizing video content.
+
+## Task
+The following summaries were written for consecutive parts of the same video, in order.
+Merge them into one summary of the whole video in two sentences: first for main topic, second for key point.
+Write the summary in {tgt_lang}.
+
+## INPUT
+<summaries>
+{themes_text}
+</summaries>
+
+## Output in only JSON format and no other text
+{{
+  "theme": "Two-sentence video summary"
+}}
+
+Note: Start you answer with ```json and end with ```, do not add any other text.
+""".strip()
+    return merge_prompt
+
 ## ================================================================
 # @ step5_translate.py & translate_lines.py
+# Translation prompts are split into a stable prefix (role, task, principles: identical for every chunk, so
+# providers can cache it) and a variable suffix (context, terms and the subtitles of this chunk).
 def generate_shared_prompt(previous_content_prompt, after_content_prompt, summary_prompt, things_to_note_prompt):
-    return f'''### Context Information
+    # leave out empty sections instead of sending "None"
+    sections = []
+    if previous_content_prompt or after_content_prompt:
+        sections.append(f'''### Context Information
 <previous_content>
 {previous_content_prompt}
 </previous_content>
 
 <subsequent_content>
 {after_content_prompt}
-</subsequent_content>
-
-### Content Summary
-{summary_prompt}
-
-### Points to Note
-{things_to_note_prompt}'''
+</subsequent_content>''')
+    if summary_prompt:
+        sections.append(f'''### Content Summary
+{summary_prompt}''')
+    if things_to_note_prompt:
+        sections.append(f'''### Points to Note
+{things_to_note_prompt}''')
+    return '\n\n'.join(sections)
 
 def get_prompt_faithfulness(lines, shared_prompt):
+    """Return (stable_prefix, variable_suffix)"""
     TARGET_LANGUAGE = load_key("target_language")
     # Split lines by \n
     line_splits = lines.split('\n')
@@ -152,7 +222,7 @@ def get_prompt_faithfulness(lines, shared_prompt):
     json_format = json.dumps(json_dict, indent=2, ensure_ascii=False)
 
     src_language = load_key("whisper.detected_language")
-    prompt_faithfulness = f'''
+    prefix_faithfulness = f'''
 ## Role
 You are a professional Netflix subtitle translator, fluent in both {src_language} and {TARGET_LANGUAGE}, as well as their respective cultures. 
 Your expertise lies in accurately understanding the semantics and structure of the original {src_language} text and faithfully translating it into {TARGET_LANGUAGE} while preserving the original meaning.
@@ -164,14 +234,17 @@ We have a segment of original {src_language} subtitles that need to be directly
 2. Ensure the translation is faithful to the original, accurately conveying the original meaning
 3. Consider the context and professional terminology
 
-{shared_prompt}
-
 <translation_principles>
 1. Faithful to the original: Accurately convey the content and meaning of the original text, without arbitrarily changing, adding, or omitting content.
 2. Accurate terminology: Use professional terms correctly and maintain consistency in terminology.
 3. Understand the context: Fully comprehend and reflect the background and contextual relationships of the text.
 </translation_principles>
 
+Note: Output in only JSON format in the structure given with the input. Start you answer with ```json and end with ```, do not add any other text.
+'''
+    suffix_faithfulness = f'''
+{shared_prompt}
+
 ## INPUT
 <subtitles>
 {lines}
@@ -181,13 +254,12 @@ We have a segment of original {src_language} subtitles that need to be directly
 ```json
 {json_format}
 ```
-
-Note: Start you answer with ```json and end with ```, do not add any other text.
 '''
-    return prompt_faithfulness.strip()
+    return prefix_faithfulness.strip(), suffix_faithfulness.strip()
 
 
 def get_prompt_expressiveness(faithfulness_result, lines, shared_prompt):
+    """Return (stable_prefix, variable_suffix)"""
     TARGET_LANGUAGE = load_key("target_language")
     json_format = {
         key: {
@@ -201,7 +273,7 @@ def get_prompt_expressiveness(faithfulness_result, lines, shared_prompt):
     json_format = json.dumps(json_format, indent=2, ensure_ascii=False)
 
     src_language = load_key("whisper.detected_language")
-    prompt_expressiveness = f'''
+    prefix_expressiveness = f'''
 ## Role
 You are a professional Netflix subtitle translator and language consultant.
 Your expertise lies not only in accurately understanding the original {src_language} but also in optimizing the {TARGET_LANGUAGE} translation to better suit the target language's expression habits and cultural background.
@@ -216,8 +288,6 @@ Your task is to reflect on and improve these direct translations to create more
 4. Do not add comments or explanations in the translation, as the subtitles are for the audience to read
 5. Do not leave empty lines in the free translation, as the subtitles are for the audience to read
 
-{shared_prompt}
-
 <Translation Analysis Steps>
 Please use a two-step thinking process to handle the text line by line:
 
@@ -231,7 +301,12 @@ Please use a two-step thinking process to handle the text line by line:
    - Ensure it's easy for {TARGET_LANGUAGE} audience to understand and accept
    - Adapt the language style to match the theme (e.g., use casual language for tutorials, professional terminology for technical content, formal language for documentaries)
 </Translation Analysis Steps>
-   
+
+Note: Output in only JSON format in the structure given with the input. Start you answer with ```json and end with ```, do not add any other text.
+'''
+    suffix_expressiveness = f'''
+{shared_prompt}
+
 ## INPUT
 <subtitles>
 {lines}
@@ -241,10 +316,8 @@ Please use a two-step thinking process to handle the text line by line:
 ```json
 {json_format}
 ```
-
-Note: Start you answer with ```json and end with ```, do not add any other text.
 '''
-    return prompt_expressiveness.strip()
+    return prefix_expressiveness.strip(), suffix_expressiveness.strip()
 
 
 ## ================================================================
@@ -334,6 +407,47 @@ Please follow these steps and provide the results in the JSON output:
 }}
 ```
 
+Note: Start you answer with ```json and end with ```, do not add any other text.
+'''.strip()
+    return trim_prompt
+
+def get_subtitle_trim_batch_prompt(items):
+    """`items` is a list of (text, duration)"""
+    given_text = '\n'.join(
+        f'<subtitle_{i} duration="{duration:.2f}s">\n{text}\n</subtitle_{i}>'
+        for i, (text, duration) in enumerate(items, 1)
+    )
+    json_format = json.dumps({
+        str(i): {"result": f"Shortened subtitle {i} in the original subtitle language"}
+        for i in range(1, len(items) + 1)
+    }, indent=2, ensure_ascii=False)
+
+    rule = '''Consider a. Reducing filler words without modifying meaningful content. b. Omitting unnecessary modifiers or pronouns, for example:
+    - "Please explain your thought process" can be shortened to "Please explain thought process"
+    - "We need to carefully analyze this complex problem" can be shortened to "We need to analyze this problem"
+    - "Let's discuss the various different perspectives on this topic" can be shortened to "Let's discuss different perspectives on this topic"
+    - "Can you describe in detail your experience from yesterday" can be shortened to "Can you describe yesterday's experience" '''
+
+    trim_prompt = f'''
+## Role
+You are a professional subtitle editor, editing and optimizing lengthy subtitles that exceed voiceover time before handing them to voice actors. 
+Your expertise lies in cleverly shortening subtitles slightly while ensuring the original meaning and structure remain unchanged.
+
+## INPUT
+Each subtitle comes with the voiceover duration it has to fit in.
+<subtitles>
+{given_text}
+</subtitles>
+
+## Processing Rules
+{rule}
+Handle every subtitle independently and keep their numbering.
+
+## Output in only JSON format and no other text
+```json
+{json_format}
+```
+
 Note: Start you answer with ```json and end with ```, do not add any other text.
 '''.strip()
     return trim_prompt
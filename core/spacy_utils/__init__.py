@@ -2,6 +2,7 @@ from .split_by_comma import split_by_comma_main
 from .split_by_connector import split_sentences_main
 from .split_by_mark import split_by_mark
 from .split_long_by_root import split_long_by_root_main
+from .split_by_rules import rule_split
 from .load_nlp_model import init_nlp
 
 __all__ = [
@@ -9,5 +10,6 @@ __all__ = [
     "split_sentences_main",
     "split_by_mark",
     "split_long_by_root_main",
+    "rule_split",
     "init_nlp"
 ]
@@ -0,0 +1,94 @@
+import warnings
+from core.utils import *
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+# --------------------
+# rule-based pre-splitter, resolves long sentences with obvious split points before asking the LLM
+# --------------------
+
+CLAUSE_MARKS = {';', ':', '；', '：', '—', '–', '--'}
+COMMA_MARKS = {',', '，', '、'}
+# CJK corner brackets, spaCy does not flag them as quotes
+OPENING_QUOTES = {'「', '『'}
+CLOSING_QUOTES = {'」', '』'}
+MIN_PART_WORDS = 3
+
+def _word_count(span):
+    return sum(1 for token in span if not token.is_punct)
+
+def _classify(doc, i, joiner=' '):
+    """Return (rule, split_index) for token i, the sentence is split before doc[split_index]"""
+    token = doc[i]
+    if token.text in CLAUSE_MARKS:
+        return 'clause_mark', i + 1
+    if token.is_bracket:
+        return ('parenthesis', i) if token.is_left_punct else ('parenthesis', i + 1)
+    if token.text in OPENING_QUOTES or token.text in CLOSING_QUOTES or token.is_quote:
+        opening = token.text in OPENING_QUOTES or (token.is_left_punct and not token.is_right_punct)
+        closing = token.text in CLOSING_QUOTES or (token.is_right_punct and not token.is_left_punct)
+        if not opening and not closing:
+            # a straight quote has no direction, without spaces between words it cannot be told apart
+            if joiner == '':
+                return None, None
+            # an opening straight quote has whitespace before it and none after it
+            opening = i > 0 and doc[i - 1].whitespace_ and not token.whitespace_
+        return ('quotation', i) if opening else ('quotation', i + 1)
+    if token.text in COMMA_MARKS:
+        if i + 1 < len(doc) and doc[i + 1].pos_ in ('CCONJ', 'SCONJ'):
+            return 'conjunction', i + 1
+        if sum(1 for t in doc if t.text in COMMA_MARKS) >= 3:
+            return 'enumeration', i + 1
+    # a plain comma is too ambiguous to split on locally, such sentences go to the LLM
+    return None, None
+
+def _best_candidate(doc, start, end, weights, joiner=' '):
+    """Score every split point inside doc[start:end], return (score, split_index) of the best one"""
+    best = (0, None)
+    for i in range(start, end):
+        rule, k = _classify(doc, i, joiner)
+        if rule is None or not start < k < end:
+            continue
+        left, right = _word_count(doc[start:k]), _word_count(doc[k:end])
+        if left < MIN_PART_WORDS or right < MIN_PART_WORDS:
+            continue
+        balance = min(left, right) / max(left, right)
+        score = weights.get(rule, 0) * (0.5 + 0.5 * balance)
+        if score > best[0]:
+            best = (score, k)
+    return best
+
+def rule_split(doc, max_length, rule_set=None, joiner=None):
+    """Split a spaCy doc into parts of at most `max_length` tokens at high-confidence punctuation.
+
+    `joiner` is the word joiner of the transcript language, read from the config when not given.
+    Returns the list of parts, or None when the sentence is ambiguous and should go to the LLM."""
+    rule_set = rule_set or load_key("rule_split")
+    if not rule_set["enabled"]:
+        return None
+    weights, min_score = rule_set["weights"], rule_set["min_score"]
+    if joiner is None:
+        whisper_language = load_key("whisper.language")
+        joiner = get_joiner(load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language)
+
+    bounds = []
+    def bisect(start, end):
+        if end - start <= max_length:
+            bounds.append((start, end))
+            return True
+        score, k = _best_candidate(doc, start, end, weights, joiner)
+        if k is None or score < min_score:
+            return False
+        return bisect(start, k) and bisect(k, end)
+
+    if not bisect(0, len(doc)):
+        return None
+    text = doc.text
+    offsets = [doc[start].idx for start, _ in bounds] + [len(text)]
+    return [text[offsets[i]:offsets[i + 1]].strip() for i in range(len(bounds))]
+
+if __name__ == "__main__":
+    from core.spacy_utils.load_nlp_model import init_nlp
+    nlp = init_nlp()
+    test = "The first thing you need to know is simple: every model we trained last year (including the small ones) was evaluated on the same benchmark."
+    print(rule_split(nlp(test), 20))
@@ -7,6 +7,7 @@ from time import sleep
 import streamlit as st
 from core._1_ytdlp import download_video_ytdlp, find_video_files
 from core.utils import *
+from core.utils.encoder_profile import video_encoder_args
 from translations.translations import translate as t
 from yt_dlp.utils import DownloadError
 
@@ -81,7 +82,7 @@ def convert_audio_to_video(audio_file: str) -> str:
     output_video = os.path.join(OUTPUT_DIR, 'black_screen.mp4')
     if not os.path.exists(output_video):
         print(f"🎵➡️🎬 Converting audio to video with FFmpeg ......")
-        ffmpeg_cmd = ['ffmpeg', '-y', '-f', 'lavfi', '-i', 'color=c=black:s=640x360', '-i', audio_file, '-shortest', '-c:v', 'libx264', '-c:a', 'aac', '-pix_fmt', 'yuv420p', output_video]
+        ffmpeg_cmd = ['ffmpeg', '-y', '-f', 'lavfi', '-i', 'color=c=black:s=640x360', '-i', audio_file, '-shortest', *video_encoder_args(gpu=False), '-c:a', 'aac', '-pix_fmt', 'yuv420p', output_video]
         subprocess.run(ffmpeg_cmd, check=True, capture_output=True, text=True, encoding='utf-8')
         print(f"🎵➡️🎬 Converted <{audio_file}> to <{output_video}> with FFmpeg\n")
         # delete audio file
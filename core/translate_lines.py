@@ -4,8 +4,20 @@ from rich.console import Console
 from rich.table import Table
 from rich import box
 from core.utils import *
+from core.utils.translation_memory import normalize_sentence
+from difflib import SequenceMatcher
 console = Console()
 
+ORIGIN_MIN_SIMILARITY = 0.9  # the echoed source may differ from the chunk in case, punctuation or a slipped word
+
+def origin_similarity(origin, lines):
+    """Similarity of the source echoed in `origin` and the chunk `lines`, both normalized line by line, 1.0 when all lines match"""
+    echoed = [normalize_sentence(line) for line in origin.split('\n')]
+    source = [normalize_sentence(line) for line in lines.split('\n')]
+    if echoed == source:
+        return 1.0
+    return SequenceMatcher(None, '\n'.join(echoed), '\n'.join(source)).ratio()
+
 def valid_translate_result(result: dict, required_keys: list, required_sub_keys: list):
     # Check for the required key
     if not all(key in result for key in required_keys):
@@ -18,53 +30,60 @@ def valid_translate_result(result: dict, required_keys: list, required_sub_keys:
 
     return {"status": "success", "message": "Translation completed"}
 
-def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
-    shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
+# Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
+def retry_translation(prompt, lines, step_name, index=0, system_prompt=None):
+    length = len(lines.split('\n'))
+    def valid_faith(response_data):
+        result = valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['direct', 'origin'])
+        if result['status'] != 'success':
+            return result
+        # the echoed source must be this chunk, line by line, otherwise the translation is for other lines
+        origin = '\n'.join(str(response_data[str(i)]['origin']) for i in range(1, length+1))
+        similarity = origin_similarity(origin, lines)
+        if similarity < ORIGIN_MIN_SIMILARITY:
+            return {"status": "error", "message": f"Echoed origin does not match the source lines (similarity: {similarity:.3f})"}
+        return result
+    def valid_express(response_data):
+        return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['free'])
+    for retry in range(3):
+        if step_name == 'faithfulness':
+            result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_faith, log_title=f'translate_{step_name}', system_prompt=system_prompt)
+        elif step_name == 'expressiveness':
+            result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_express, log_title=f'translate_{step_name}', system_prompt=system_prompt)
+        if length == len(result):
+            return result
+        if retry != 2:
+            console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
+    raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
 
-    # Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
-    def retry_translation(prompt, length, step_name):
-        def valid_faith(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['direct'])
-        def valid_express(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['free'])
-        for retry in range(3):
-            if step_name == 'faithfulness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_faith, log_title=f'translate_{step_name}')
-            elif step_name == 'expressiveness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_express, log_title=f'translate_{step_name}')
-            if len(lines.split('\n')) == len(result):
-                return result
-            if retry != 2:
-                console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
-        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
-
-    ## Step 1: Faithful to the Original Text
-    prompt1 = get_prompt_faithfulness(lines, shared_prompt)
-    faith_result = retry_translation(prompt1, len(lines.split('\n')), 'faithfulness')
+def translate_faithfully(lines, shared_prompt, index = 0):
+    """Step 1: Faithful to the Original Text, return the per-line faithfulness result"""
+    prefix1, prompt1 = get_prompt_faithfulness(lines, shared_prompt)
+    faith_result = retry_translation(prompt1, lines, 'faithfulness', index, system_prompt=prefix1)
 
     for i in faith_result:
         faith_result[i]["direct"] = faith_result[i]["direct"].replace('\n', ' ')
+    return faith_result
 
-    # If reflect_translate is False or not set, use faithful translation directly
-    reflect_translate = load_key('reflect_translate')
-    if not reflect_translate:
-        # If reflect_translate is False or not set, use faithful translation directly
-        translate_result = "\n".join([faith_result[i]["direct"].strip() for i in faith_result])
-        
-        table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
-        table.add_column("Translations", style="bold")
-        for i, key in enumerate(faith_result):
-            table.add_row(f"[cyan]Origin:  {faith_result[key]['origin']}[/cyan]")
-            table.add_row(f"[magenta]Direct:  {faith_result[key]['direct']}[/magenta]")
-            if i < len(faith_result) - 1:
-                table.add_row("[yellow]" + "-" * 50 + "[/yellow]")
-        
-        console.print(table)
-        return translate_result, lines
-
-    ## Step 2: Express Smoothly  
-    prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
-    express_result = retry_translation(prompt2, len(lines.split('\n')), 'expressiveness')
+def faith_to_translation(faith_result):
+    """Use the faithful translation directly, when reflect_translate is off"""
+    translate_result = "\n".join([faith_result[i]["direct"].strip() for i in faith_result])
+    
+    table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
+    table.add_column("Translations", style="bold")
+    for i, key in enumerate(faith_result):
+        table.add_row(f"[cyan]Origin:  {faith_result[key]['origin']}[/cyan]")
+        table.add_row(f"[magenta]Direct:  {faith_result[key]['direct']}[/magenta]")
+        if i < len(faith_result) - 1:
+            table.add_row("[yellow]" + "-" * 50 + "[/yellow]")
+    
+    console.print(table)
+    return translate_result
+
+def translate_expressively(lines, faith_result, shared_prompt, index = 0):
+    """Step 2: Express Smoothly, based on the faithfulness result"""
+    prefix2, prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
+    express_result = retry_translation(prompt2, lines, 'expressiveness', index, system_prompt=prefix2)
 
     table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
     table.add_column("Translations", style="bold")
@@ -83,7 +102,19 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
         console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.json`[/red]'))
         raise ValueError(f'Origin ···{lines}···,\nbut got ···{translate_result}···')
 
-    return translate_result, lines
+    return translate_result
+
+def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
+    """Both steps for one chunk, return (translation, echoed origin)"""
+    shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
+    faith_result = translate_faithfully(lines, shared_prompt, index)
+
+    # If reflect_translate is False or not set, use faithful translation directly
+    origin = '\n'.join(str(faith_result[key]['origin']) for key in faith_result)
+    if not load_key('reflect_translate'):
+        return faith_to_translation(faith_result), origin
+
+    return translate_expressively(lines, faith_result, shared_prompt, index), origin
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
 import syllables
 from pypinyin import pinyin, Style
 from g2p_en import G2p
-from typing import Optional
+from typing import List, Optional
+from functools import lru_cache
+import time
 import re
 
+SYLLABLE_CACHE_SIZE = 65536
+
 class AdvancedSyllableEstimator:
     def __init__(self):
         self.g2p_en = G2p()
@@ -12,10 +16,29 @@ class AdvancedSyllableEstimator:
             'zh': r'[\u4e00-\u9fff]', 'ja': r'[\u3040-\u309f\u30a0-\u30ff]',
             'fr': r'[àâçéèêëîïôùûüÿœæ]', 'es': r'[áéíóúñ¿¡]', 'en': r'[a-zA-Z]+', 'ko': r'[\uac00-\ud7af\u1100-\u11ff]'}
         self.lang_joiners = {'zh': '', 'ja': '', 'en': ' ', 'fr': ' ', 'es': ' ', 'ko': ' '}
+        # learned from the real TTS durations of the configured voice, see speaking_rate.py
+        self.rate_scale = 1.0
         self.punctuation = {
             'mid': r'[，；：,;、]+', 'end': r'[。！？.!?]+', 'space': r'\s+',
             'pause': {'space': 0.15, 'default': 0.1}
         }
+        # compile every pattern once, detection keeps the priority order of lang_patterns
+        self._lang_regexes = [(lang, re.compile(pattern)) for lang, pattern in self.lang_patterns.items()]
+        self._split_regex = re.compile(f"({self.punctuation['space']}|{self.punctuation['mid']}|{self.punctuation['end']})")
+        self._space_regex = re.compile(self.punctuation['space'])
+        self._non_zh_regex = re.compile(r'[^\u4e00-\u9fff]')
+        self._ja_youon_regex = re.compile(r'[きぎしじちぢにひびぴみり][ょゅゃ]')
+        self._ja_skip_regex = re.compile(r'[っー]')
+        self._ja_mora_regex = re.compile(r'[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff]')
+        self._fr_silent_e_regex = re.compile(r'e\b')
+        self._vowel_regexes = {
+            'fr': re.compile('[aeiouyàâéèêëîïôùûüÿœæ]+'),
+            'es': re.compile('[aeiouáéíóúü]+')
+        }
+        self._ko_regex = re.compile(r'[\uac00-\ud7af]')
+        # subtitles repeat the same words over and over, remember them per estimator
+        self._word_syllables = lru_cache(maxsize=SYLLABLE_CACHE_SIZE)(self._count_word_syllables)
+        self._detect_language = lru_cache(maxsize=SYLLABLE_CACHE_SIZE)(self._detect_language)
 
     def estimate_duration(self, text: str, lang: Optional[str] = None) -> float:
         syllable_count = self.count_syllables(text, lang)
@@ -24,41 +47,34 @@ class AdvancedSyllableEstimator:
     def count_syllables(self, text: str, lang: Optional[str] = None) -> int:
         if not text.strip(): return 0
         lang = lang or self._detect_language(text)
-        
-        vowels_map = {
-            'fr': 'aeiouyàâéèêëîïôùûüÿœæ',
-            'es': 'aeiouáéíóúü'
-        }
-        
         if lang == 'en':
-            return self._count_english_syllables(text)
+            return max(1, sum(self._word_syllables(word, lang) for word in text.strip().split()))
+        return self._word_syllables(text, lang)
+
+    def _count_word_syllables(self, text: str, lang: str) -> int:
+        if lang == 'en':
+            try:
+                return syllables.estimate(text)
+            except:
+                phones = self.g2p_en(text)
+                return max(1, len([p for p in phones if any(c in p for c in 'aeiou')]))
         elif lang == 'zh':
-            text = re.sub(r'[^\u4e00-\u9fff]', '', text)
+            text = self._non_zh_regex.sub('', text)
             return len(pinyin(text, style=Style.NORMAL))
         elif lang == 'ja':
-            text = re.sub(r'[きぎしじちぢにひびぴみり][ょゅゃ]', 'X', text)
-            text = re.sub(r'[っー]', '', text)
-            return len(re.findall(r'[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff]', text))
+            text = self._ja_youon_regex.sub('X', text)
+            text = self._ja_skip_regex.sub('', text)
+            return len(self._ja_mora_regex.findall(text))
         elif lang in ('fr', 'es'):
-            text = re.sub(r'e\b', '', text.lower()) if lang == 'fr' else text.lower()
-            return max(1, len(re.findall(f'[{vowels_map[lang]}]+', text)))
+            text = self._fr_silent_e_regex.sub('', text.lower()) if lang == 'fr' else text.lower()
+            return max(1, len(self._vowel_regexes[lang].findall(text)))
         elif lang == 'ko':
-            return len(re.findall(r'[\uac00-\ud7af]', text))
+            return len(self._ko_regex.findall(text))
         return len(text.split())
 
-    def _count_english_syllables(self, text: str) -> int:
-        total = 0
-        for word in text.strip().split():
-            try:
-                total += syllables.estimate(word)
-            except:
-                phones = self.g2p_en(word)
-                total += max(1, len([p for p in phones if any(c in p for c in 'aeiou')]))
-        return max(1, total)
-
     def _detect_language(self, text: str) -> str:
-        for lang, pattern in self.lang_patterns.items():
-            if re.search(pattern, text): return lang
+        for lang, regex in self._lang_regexes:
+            if regex.search(text): return lang
         return 'en'
 
     def process_mixed_text(self, text: str) -> dict:
@@ -72,48 +88,75 @@ class AdvancedSyllableEstimator:
             }
             
         result = {'language_breakdown': {}, 'total_syllables': 0, 'punctuation': [], 'spaces': []}
-        segments = re.split(f"({self.punctuation['space']}|{self.punctuation['mid']}|{self.punctuation['end']})", text)
+        # the split alternates text (even indices) and delimiters (odd indices)
+        segments = self._split_regex.split(text)
+        # detect every text segment once, delimiters look up their neighbours here
+        langs = [self._detect_language(segment) if i % 2 == 0 else None for i, segment in enumerate(segments)]
         total_duration = 0
         
         for i, segment in enumerate(segments):
             if not segment: continue
             
-            if re.match(self.punctuation['space'], segment):
-                prev_lang = self._detect_language(segments[i-1]) if i > 0 else None
-                next_lang = self._detect_language(segments[i+1]) if i < len(segments)-1 else None
-                if prev_lang and next_lang and (self.lang_joiners[prev_lang] == '' or self.lang_joiners[next_lang] == ''):
-                    result['spaces'].append(segment)
-                    total_duration += self.punctuation['pause']['space']
-            elif re.match(f"{self.punctuation['mid']}|{self.punctuation['end']}", segment):
-                result['punctuation'].append(segment)
-                total_duration += self.punctuation['pause']['default']
+            if i % 2 == 1:
+                if self._space_regex.match(segment):
+                    prev_lang = langs[i-1]
+                    next_lang = langs[i+1]
+                    if self.lang_joiners[prev_lang] == '' or self.lang_joiners[next_lang] == '':
+                        result['spaces'].append(segment)
+                        total_duration += self.punctuation['pause']['space']
+                else:
+                    result['punctuation'].append(segment)
+                    total_duration += self.punctuation['pause']['default']
             else:
-                lang = self._detect_language(segment)
-                if lang:
-                    syllables = self.count_syllables(segment, lang)
-                    if lang not in result['language_breakdown']:
-                        result['language_breakdown'][lang] = {'syllables': 0, 'text': ''}
-                    result['language_breakdown'][lang]['syllables'] += syllables
-                    result['language_breakdown'][lang]['text'] += (self.lang_joiners[lang] + segment 
-                        if result['language_breakdown'][lang]['text'] else segment)
-                    result['total_syllables'] += syllables
-                    total_duration += syllables * self.duration_params.get(lang, self.duration_params['default'])
+                lang = langs[i]
+                syllables = self.count_syllables(segment, lang)
+                if lang not in result['language_breakdown']:
+                    result['language_breakdown'][lang] = {'syllables': 0, 'text': ''}
+                result['language_breakdown'][lang]['syllables'] += syllables
+                result['language_breakdown'][lang]['text'] += (self.lang_joiners[lang] + segment 
+                    if result['language_breakdown'][lang]['text'] else segment)
+                result['total_syllables'] += syllables
+                total_duration += syllables * self.duration_params.get(lang, self.duration_params['default'])
         
         result['estimated_duration'] = total_duration
         
         return result
     
-def init_estimator():
-    return AdvancedSyllableEstimator()
+def init_estimator(calibrated: bool = True):
+    estimator = AdvancedSyllableEstimator()
+    if calibrated:
+        from core.tts_backend.speaking_rate import load_rate_scale
+        estimator.rate_scale = load_rate_scale()
+    return estimator
 
 def estimate_duration(text: str, estimator: AdvancedSyllableEstimator):
     if not text or not isinstance(text, str):
         return 0
-    return estimator.process_mixed_text(text)['estimated_duration']
+    return estimator.process_mixed_text(text)['estimated_duration'] * estimator.rate_scale
+
+def estimate_duration_batch(texts: List[str], estimator: AdvancedSyllableEstimator) -> List[float]:
+    """Estimate a whole column of texts, repeated lines are only processed once"""
+    unique = {text: estimate_duration(text, estimator) for text in dict.fromkeys(t for t in texts if isinstance(t, str))}
+    return [unique.get(text, 0) if isinstance(text, str) else 0 for text in texts]
+
+def benchmark(estimator: AdvancedSyllableEstimator, texts: List[str], rounds: int = 5):
+    """Micro-benchmark in lines per second: cold word caches, warm word caches, and the batch API"""
+    def lines_per_second(run, repeat=1):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return len(texts) * repeat / (time.perf_counter() - start)
+    estimator._word_syllables.cache_clear()
+    estimator._detect_language.cache_clear()
+    cold = lines_per_second(lambda: [estimate_duration(text, estimator) for text in texts])
+    warm = lines_per_second(lambda: [estimate_duration(text, estimator) for text in texts], rounds)
+    batch = lines_per_second(lambda: estimate_duration_batch(texts, estimator), rounds)
+    print(f"Estimated {len(texts)} lines: {cold:,.0f} lines/s cold, {warm:,.0f} lines/s warm, {batch:,.0f} lines/s batched")
+    return cold, warm, batch
 
 # 使用示例
 if __name__ == "__main__":
-    estimator = init_estimator()
+    estimator = init_estimator(calibrated=False)
     print(estimate_duration('你好', estimator))
 
     # 测试用例
@@ -136,4 +179,11 @@ if __name__ == "__main__":
         for lang, info in result['language_breakdown'].items():
             print(f"- {lang}: {info['syllables']} syllables ({info['text']})")
         print(f"Punctuation: {result['punctuation']}")
-        print(f"Spaces: {result['spaces']}")
\ No newline at end of file
+        print(f"Spaces: {result['spaces']}")
+
+    benchmark(estimator, [
+        "I couldn't help but notice the vibrant colors of the autumn leaves cascading gently from the trees",
+        "The weather is nice 所以我们去公园",
+        "我们需要在输出中体现空格的停顿时间",
+        "가을 나뭇잎이 부드럽게 떨어지는 생생한 색깔을 주목하지 않을 수 없었다",
+    ] * 250)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+from core.utils import *
+from core.utils.models import _CACHE_DIR, _SPEAKING_RATE_MODEL
+
+# ------------
+# learned speaking rate per (tts_method, voice, language)
+# ------------
+
+# config key of the voice setting of each tts method, methods without one share a single model
+VOICE_KEYS = {
+    'sf_fish_tts': 'sf_fish_tts.voice',
+    'openai_tts': 'openai_tts.voice',
+    'azure_tts': 'azure_tts.voice',
+    'fish_tts': 'fish_tts.character',
+    'edge_tts': 'edge_tts.voice',
+    'gpt_sovits': 'gpt_sovits.character',
+}
+PRIOR_WEIGHT = 20.0  # seconds² of pseudo-observations at rate 1, keeps a few lines from swinging the model
+DECAY = 0.9  # weight kept by older runs every time the model is updated
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+MIN_RATIO, MAX_RATIO = 0.3, 3.0  # lines outside this real / estimated ratio are failed or silent TTS
+
+_LOCK = threading.Lock()
+
+def get_voice_key():
+    tts_method = load_key("tts_method")
+    voice = load_key(VOICE_KEYS[tts_method]) if tts_method in VOICE_KEYS else ''
+    return f"{tts_method}|{voice}|{load_key('target_language')}"
+
+class SpeakingRateModel:
+    """Fits real_dur ≈ scale * estimated_dur per voice by least squares through the origin.
+
+    Only the sufficient statistics are stored, so every run adds its lines without refitting from scratch."""
+
+    def __init__(self, path=_SPEAKING_RATE_MODEL):
+        self.path = path
+        self.voices = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.voices = json.load(f)
+
+    def scale(self, voice_key):
+        stats = self.voices.get(voice_key)
+        if not stats:
+            return 1.0
+        scale = (stats['sum_xy'] + PRIOR_WEIGHT) / (stats['sum_xx'] + PRIOR_WEIGHT)
+        return min(MAX_SCALE, max(MIN_SCALE, scale))
+
+    def update(self, voice_key, pairs):
+        """Add the (estimated, real) durations of one run"""
+        stats = self.voices.get(voice_key, {'sum_xy': 0.0, 'sum_xx': 0.0, 'lines': 0})
+        stats = {
+            'sum_xy': stats['sum_xy'] * DECAY + sum(x * y for x, y in pairs),
+            'sum_xx': stats['sum_xx'] * DECAY + sum(x * x for x, _ in pairs),
+            'lines': stats['lines'] + len(pairs),
+        }
+        self.voices[voice_key] = stats
+
+    def save(self):
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.voices, f, ensure_ascii=False, indent=4)
+
+def valid_pairs(estimated, real):
+    """(estimated, real) duration pairs, without lines whose TTS failed or fell back to silence"""
+    return [(x, y) for x, y in zip(estimated, real) if x > 0 and y > 0 and MIN_RATIO <= y / x <= MAX_RATIO]
+
+def load_rate_scale():
+    """Rate scale of the configured voice, 1.0 when calibration is off or nothing was learned yet"""
+    if not load_key("speaking_rate.calibrate"):
+        return 1.0
+    with _LOCK:
+        return SpeakingRateModel().scale(get_voice_key())
+
+def calibrate_speaking_rate(estimated, real):
+    """Fit the configured voice on the lines of this run and persist the model"""
+    if not load_key("speaking_rate.calibrate"):
+        return
+    voice_key = get_voice_key()
+    pairs = valid_pairs(estimated, real)
+    if not pairs:
+        return
+    with _LOCK:
+        model = SpeakingRateModel()
+        old_scale = model.scale(voice_key)
+        model.update(voice_key, pairs)
+        model.save()
+        new_scale = model.scale(voice_key)
+
+    # relative duration error of this run with the fixed rate, the rate used for planning and the updated rate
+    error = lambda scale: sum(abs(x * scale - y) / y for x, y in pairs) / len(pairs)
+    rprint(f"[cyan]🎙️ Speaking rate of `{voice_key}` fitted on {len(pairs)} lines: scale {old_scale:.3f} → {new_scale:.3f}, "
+           f"duration error {error(1.0):.1%} fixed rate, {error(old_scale):.1%} used this run, {error(new_scale):.1%} next run[/cyan]")
@@ -1,10 +1,10 @@
 # use try-except to avoid error when installing
 try:
-    from .ask_gpt import ask_gpt
+    from .ask_gpt import ask_gpt, estimate_tokens
     from .decorator import except_handler, check_file_exists
     from .config_utils import load_key, update_key, get_joiner
     from rich import print as rprint
 except ImportError:
     pass
 
-__all__ = ["ask_gpt", "except_handler", "check_file_exists", "load_key", "update_key", "rprint", "get_joiner"]
\ No newline at end of file
+__all__ = ["ask_gpt", "estimate_tokens", "except_handler", "check_file_exists", "load_key", "update_key", "rprint", "get_joiner"]
\ No newline at end of file
@@ -1,6 +1,9 @@
 import os
+import re
 import json
+import math
 from threading import Lock
+from collections import Counter, defaultdict
 import json_repair
 from openai import OpenAI
 from core.utils.config_utils import load_key
@@ -36,16 +39,45 @@ def _load_cache(prompt, resp_type, log_title):
                         return item["resp"]
         return False
 
+# ------------
+# request stats per log_title, read by stages that tune themselves
+# ------------
+
+REQUEST_STATS = defaultdict(Counter)
+
+def record_stat(log_title, key, value=1):
+    with LOCK:
+        REQUEST_STATS[log_title][key] += value
+
+def _record_usage(log_title, usage):
+    """Input tokens as billed by the provider, and how many of them were served from its prompt cache"""
+    if usage is None:
+        return
+    record_stat(log_title, 'usage_prompt_tokens', getattr(usage, 'prompt_tokens', 0) or 0)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    record_stat(log_title, 'usage_cached_tokens', (getattr(details, 'cached_tokens', 0) or 0) if details else 0)
+
+# ------------
+# estimate prompt size
+# ------------
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer: ~1 token per CJK character, ~4 characters per token otherwise"""
+    cjk = len(re.findall(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]', text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
 # ------------
 # ask gpt once
 # ------------
 
 @except_handler("GPT request failed", retry=5)
-def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
+def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default", system_prompt=None):
+    """`system_prompt` is the stable prefix shared by many requests, sent first so providers can cache it"""
     if not load_key("api.key"):
         raise ValueError("API key is not set")
+    cache_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
     # check cache
-    cached = _load_cache(prompt, resp_type, log_title)
+    cached = _load_cache(cache_prompt, resp_type, log_title)
     if cached:
         rprint("use cache response")
         return cached
@@ -60,6 +92,12 @@ def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
     response_format = {"type": "json_object"} if resp_type == "json" and load_key("api.llm_support_json") else None
 
     messages = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        system_content = system_prompt
+        if load_key("api.prompt_cache_hint"):
+            # explicit cache breakpoint, for providers that do not cache prefixes automatically
+            system_content = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        messages.insert(0, {"role": "system", "content": system_content})
 
     params = dict(
         model=model,
@@ -67,7 +105,12 @@ def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
         response_format=response_format,
         timeout=300
     )
+    record_stat(log_title, 'requests')
+    record_stat(log_title, 'input_tokens', estimate_tokens(cache_prompt))
+    if system_prompt:
+        record_stat(log_title, 'prefix_tokens', estimate_tokens(system_prompt))
     resp_raw = client.chat.completions.create(**params)
+    _record_usage(log_title, getattr(resp_raw, 'usage', None))
 
     # process and return full result
     resp_content = resp_raw.choices[0].message.content
@@ -80,10 +123,11 @@ def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
     if valid_def:
         valid_resp = valid_def(resp)
         if valid_resp['status'] != 'success':
-            _save_cache(model, prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'])
+            record_stat(log_title, 'failures')
+            _save_cache(model, cache_prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'])
             raise ValueError(f"❎ API response error: {valid_resp['message']}")
 
-    _save_cache(model, prompt, resp_content, resp_type, resp, log_title=log_title)
+    _save_cache(model, cache_prompt, resp_content, resp_type, resp, log_title=log_title)
     return resp
 
 
@@ -4,7 +4,8 @@ import shutil
 def delete_dubbing_files():
     files_to_delete = [
         os.path.join("output", "dub.wav"),
-        os.path.join("output", "output_dub.mp4")
+        os.path.join("output", "output_dub.mp4"),
+        os.path.join("output", "output_dub.mkv")
     ]
     
     for file_path in files_to_delete:
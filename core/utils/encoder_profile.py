@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+import platform
+import tempfile
+import subprocess
+import threading
+from rich.console import Console
+from rich.table import Table
+from core.utils.config_utils import load_key
+from core.utils.models import _CACHE_DIR, _ENCODER_PROBE
+
+# ------------
+# encoder probe and encoding profile shared by every ffmpeg encode
+# ------------
+
+console = Console()
+
+GPU_ENCODER = 'h264_nvenc'
+CPU_ENCODER = 'libx264'
+# x264 preset picked by `encoder.preset: auto`, by the number of cores of the host
+AUTO_PRESETS = [(4, 'superfast'), (8, 'veryfast'), (16, 'faster')]
+AUTO_PRESET_MANY_CORES = 'fast'
+BENCHMARK_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium']
+
+_LOCK = threading.Lock()
+_host = None
+_results = {}
+
+def _host_key():
+    """Hash of the ffmpeg build (full `ffmpeg -version`), the GPU and driver, and the host name, a probe
+    result is only reused while all of them are unchanged"""
+    version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+    try:
+        gpu = subprocess.run(['nvidia-smi', '--query-gpu=name,driver_version', '--format=csv,noheader'],
+                             capture_output=True, text=True).stdout
+    except FileNotFoundError:
+        gpu = ''
+    return hashlib.md5(f"{platform.node()}\n{version}\n{gpu}".encode('utf-8')).hexdigest()
+
+def _trial_encode(args):
+    """A 0.1s trial encode, fails for hardware encoders without a device and for options the build does not know"""
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=black:s=256x256:d=0.1', *args, '-f', 'null', '-'],
+        capture_output=True, text=True
+    )
+    return result.returncode == 0
+
+def encoder_works(args):
+    """Whether ffmpeg encodes with exactly these arguments, probed once per host key and cached in _ENCODER_PROBE"""
+    global _host
+    key = ' '.join(args)
+    with _LOCK:
+        if key in _results:
+            return _results[key]
+        try:
+            _host = _host or _host_key()
+        except FileNotFoundError:
+            return False
+        cache = {}
+        if os.path.exists(_ENCODER_PROBE):
+            with open(_ENCODER_PROBE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        # results of other ffmpeg builds or GPUs are dropped
+        cache = {_host: cache.get(_host, {})}
+        if key not in cache[_host]:
+            cache[_host][key] = _trial_encode(args)
+            os.makedirs(_CACHE_DIR, exist_ok=True)
+            with open(_ENCODER_PROBE, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=4)
+        _results[key] = cache[_host][key]
+        return _results[key]
+
+def nvenc_candidates(crf):
+    """NVENC arguments in order of preference, p1-p7 presets need ffmpeg 4.3+ and a recent NVENC SDK,
+    plain NVENC is what `ffmpeg_gpu` always used"""
+    return [
+        ['-c:v', GPU_ENCODER, '-preset', 'p4', '-rc', 'vbr', '-cq', str(crf)],
+        ['-c:v', GPU_ENCODER],
+    ]
+
+def auto_preset(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    for max_cores, preset in AUTO_PRESETS:
+        if cpu_count <= max_cores:
+            return preset
+    return AUTO_PRESET_MANY_CORES
+
+def video_encoder_args(gpu=None, threads=None):
+    """ffmpeg video encoding arguments for this host.
+
+    With `ffmpeg_gpu` the first NVENC argument list that passes its trial encode is used, otherwise x264
+    with the configured preset (`auto` picks one by core count), CRF and thread count. `threads` overrides
+    the configured thread count, e.g. for encodes that run side by side."""
+    encoder_set = load_key("encoder")
+    gpu = load_key("ffmpeg_gpu") if gpu is None else gpu
+    if gpu:
+        for args in nvenc_candidates(encoder_set['crf']):
+            if encoder_works(args):
+                return args
+        console.print(f"[yellow]⚠️ {GPU_ENCODER} is not usable on this host, encoding on CPU[/yellow]")
+    threads = threads or encoder_set['threads'] or os.cpu_count() or 1
+    preset = auto_preset() if encoder_set['preset'] == 'auto' else encoder_set['preset']
+    args = ['-c:v', CPU_ENCODER, '-preset', preset, '-crf', str(encoder_set['crf']), '-threads', str(threads)]
+    if encoder_works(args) or not encoder_works(['-threads', str(threads)]):
+        return args
+    # ffmpeg built without x264 or an unknown preset, keep ffmpeg's default encoder
+    console.print(f"[yellow]⚠️ `{' '.join(args)}` failed its trial encode, using ffmpeg's default encoder[/yellow]")
+    return ['-threads', str(threads)]
+
+def benchmark_encoders(seconds=10, size='1920x1080'):
+    """Encode fps and output size of every usable encoder and x264 preset on a synthetic clip"""
+    crf = load_key("encoder.crf")
+    matrix = [['-c:v', CPU_ENCODER, '-preset', preset, '-crf', str(crf), '-threads', str(os.cpu_count() or 1)] for preset in BENCHMARK_PRESETS]
+    matrix.extend(args for args in nvenc_candidates(crf) if encoder_works(args))
+
+    table = Table(title=f"🎞️ Encoder benchmark, {seconds}s of {size} on {os.cpu_count()} cores")
+    for column in ("Encoder", "Arguments", "FPS", "Size (MB)"):
+        table.add_column(column)
+    output = os.path.join(tempfile.gettempdir(), 'encoder_benchmark.mp4')
+    for args in matrix:
+        start_time = time.perf_counter()
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+                        *args, '-pix_fmt', 'yuv420p', '-y', output], check=True)
+        elapsed = time.perf_counter() - start_time
+        table.add_row(args[1], ' '.join(args[2:]), f"{seconds * 30 / elapsed:.1f}", f"{os.path.getsize(output) / 1e6:.2f}")
+        os.remove(output)
+    console.print(table)
+
+if __name__ == '__main__':
+    benchmark_encoders()
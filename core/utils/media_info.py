@@ -0,0 +1,83 @@
+import os
+import json
+import subprocess
+import threading
+from fractions import Fraction
+from typing import List, NamedTuple, Optional
+
+# ------------
+# media info from one ffprobe call per file, cached for the run
+# ------------
+
+class AudioStream(NamedTuple):
+    index: int
+    codec: str
+    channels: int
+    sample_rate: int
+    language: Optional[str]
+
+class MediaInfo(NamedTuple):
+    """`width` / `height` are the displayed size, swapped for videos rotated by 90°. Video fields are 0 / None
+    for audio-only files. `start_time` is the container start, which ffmpeg subtracts from every output timestamp"""
+    width: int
+    height: int
+    fps: float
+    duration: float
+    start_time: float
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    audio_streams: List[AudioStream]
+
+_LOCK = threading.Lock()
+_cache = {}
+
+def _rotation(stream):
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(float(side_data['rotation']))
+    return int(stream.get('tags', {}).get('rotate', 0))
+
+def _frame_rate(stream):
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        rate = stream.get(key, '0/0')
+        if not rate.endswith('/0'):
+            return float(Fraction(rate))
+    return 0.0
+
+def parse_media_info(probe: dict) -> MediaInfo:
+    """MediaInfo from the JSON of `ffprobe -show_streams -show_format`"""
+    streams = probe.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = [
+        AudioStream(
+            index=int(s['index']), codec=s.get('codec_name'), channels=int(s.get('channels', 0)),
+            sample_rate=int(s.get('sample_rate', 0)), language=s.get('tags', {}).get('language')
+        )
+        for s in streams if s.get('codec_type') == 'audio'
+    ]
+    width, height = (int(video.get('width', 0)), int(video.get('height', 0))) if video else (0, 0)
+    if video and _rotation(video) % 180:
+        width, height = height, width
+    duration = probe.get('format', {}).get('duration') or (video or {}).get('duration') or 0
+    return MediaInfo(
+        width=width, height=height, fps=_frame_rate(video) if video else 0.0, duration=float(duration),
+        start_time=float(probe.get('format', {}).get('start_time') or 0),
+        video_codec=video.get('codec_name') if video else None,
+        audio_codec=audio[0].codec if audio else None, audio_streams=audio,
+    )
+
+def get_media_info(path: str) -> MediaInfo:
+    """Media info of `path`, ffprobe runs once per file version (path, size, mtime) in this process"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _LOCK:
+        if key in _cache:
+            return _cache[key]
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', path],
+        capture_output=True, text=True, encoding='utf-8', check=True
+    )
+    info = parse_media_info(json.loads(result.stdout))
+    with _LOCK:
+        _cache[key] = info
+    return info
@@ -9,6 +9,7 @@ _4_1_TERMINOLOGY = "output/log/terminology.json"
 _4_2_TRANSLATION = "output/log/translation_results.xlsx"
 _5_SPLIT_SUB = "output/log/translation_results_for_subtitles.xlsx"
 _5_REMERGED = "output/log/translation_results_remerged.xlsx"
+_6_ALIGNED_TIMELINE = "output/log/aligned_timeline.json"
 
 _8_1_AUDIO_TASK = "output/audio/tts_tasks.xlsx"
 
@@ -25,6 +26,15 @@ _AUDIO_REFERS_DIR = "output/audio/refers"
 _AUDIO_SEGS_DIR = "output/audio/segs"
 _AUDIO_TMP_DIR = "output/audio/tmp"
 
+# ------------------------------------------
+# 定义跨视频持久化文件 (not archived by cleanup)
+# ------------------------------------------
+_CACHE_DIR = "cache"
+_TRANSLATE_CHUNK_STATS = "cache/translate_chunk_stats.json"
+_TRANSLATION_MEMORY = "cache/translation_memory.json"
+_SPEAKING_RATE_MODEL = "cache/speaking_rate.json"
+_ENCODER_PROBE = "cache/encoder_probe.json"
+
 # ------------------------------------------
 # 导出
 # ------------------------------------------
@@ -37,6 +47,7 @@ __all__ = [
     "_4_2_TRANSLATION",
     "_5_SPLIT_SUB",
     "_5_REMERGED",
+    "_6_ALIGNED_TIMELINE",
     "_8_1_AUDIO_TASK",
     "_OUTPUT_DIR",
     "_AUDIO_DIR",
@@ -45,5 +56,10 @@ __all__ = [
     "_BACKGROUND_AUDIO_FILE",
     "_AUDIO_REFERS_DIR",
     "_AUDIO_SEGS_DIR",
-    "_AUDIO_TMP_DIR"
+    "_AUDIO_TMP_DIR",
+    "_CACHE_DIR",
+    "_TRANSLATE_CHUNK_STATS",
+    "_TRANSLATION_MEMORY",
+    "_SPEAKING_RATE_MODEL",
+    "_ENCODER_PROBE"
 ]
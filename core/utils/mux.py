@@ -0,0 +1,79 @@
+import os
+import subprocess
+from core.utils.config_utils import load_key
+
+# ------------
+# soft subtitle delivery: subtitle (and dubbed audio) tracks muxed next to the copied video stream
+# ------------
+
+# ISO 639-1 → ISO 639-2 codes written into the track language tags
+ISO_639_2 = {
+    'en': 'eng', 'zh': 'zho', 'ja': 'jpn', 'ko': 'kor', 'fr': 'fra', 'de': 'deu', 'es': 'spa', 'ru': 'rus',
+    'it': 'ita', 'pt': 'por', 'ar': 'ara', 'hi': 'hin', 'th': 'tha', 'vi': 'vie', 'id': 'ind', 'tr': 'tur',
+    'nl': 'nld', 'pl': 'pol', 'uk': 'ukr', 'ms': 'msa', 'sv': 'swe', 'cs': 'ces', 'el': 'ell', 'he': 'heb',
+}
+# names `target_language` is written with (English, native and Chinese), matched case-insensitively
+LANGUAGE_NAMES = {
+    'en': ('english', '英语', '英文'), 'zh': ('chinese', 'mandarin', 'cantonese', '中文', '汉语', '漢語', '普通话', '粤语', '粵語'),
+    'ja': ('japanese', '日本語', '日语', '日文'), 'ko': ('korean', '한국어', '韩语', '韩文'),
+    'fr': ('french', 'français', '法语'), 'de': ('german', 'deutsch', '德语'), 'es': ('spanish', 'español', '西班牙语'),
+    'ru': ('russian', 'русский', '俄语'), 'it': ('italian', 'italiano', '意大利语'), 'pt': ('portuguese', 'português', '葡萄牙语'),
+    'ar': ('arabic', 'العربية', '阿拉伯语'), 'hi': ('hindi', 'हिन्दी', '印地语'), 'th': ('thai', 'ไทย', '泰语'),
+    'vi': ('vietnamese', 'tiếng việt', '越南语'), 'id': ('indonesian', 'bahasa indonesia', '印尼语'), 'tr': ('turkish', 'türkçe', '土耳其语'),
+    'nl': ('dutch', 'nederlands', '荷兰语'), 'pl': ('polish', 'polski', '波兰语'), 'uk': ('ukrainian', 'українська', '乌克兰语'),
+    'ms': ('malay', 'bahasa melayu', '马来语'), 'sv': ('swedish', 'svenska', '瑞典语'), 'cs': ('czech', 'čeština', '捷克语'),
+    'el': ('greek', 'ελληνικά', '希腊语'), 'he': ('hebrew', 'עברית', '希伯来语'),
+}
+# subtitle codec per container, MP4 only carries mov_text text tracks
+SUBTITLE_CODECS = {'mp4': 'mov_text', 'mkv': 'srt'}
+
+def language_tag(code: str) -> str:
+    code = (code or '').strip().lower()
+    if len(code) == 3:
+        return code
+    return ISO_639_2.get(code[:2], 'und')
+
+def source_language_tag() -> str:
+    language = load_key("whisper.language")
+    return language_tag(load_key("whisper.detected_language") if language == 'auto' else language)
+
+def target_language_tag() -> str:
+    """Tag of the free-text `target_language`: a language code as is, otherwise the language whose name
+    appears first in it, 'und' (undetermined) when none does"""
+    target = str(load_key("target_language")).strip().lower()
+    if target.split('-')[0] in ISO_639_2:  # written as a code, e.g. 'en' or 'zh-CN'
+        return language_tag(target.split('-')[0])
+    found = [(target.find(name), code) for code, names in LANGUAGE_NAMES.items() for name in names if name in target]
+    return language_tag(min(found)[1]) if found else 'und'
+
+def soft_output_path(path: str) -> str:
+    """`path` with the extension of the configured container"""
+    return f"{os.path.splitext(path)[0]}.{load_key('soft_subtitles.container')}"
+
+def delivered_video(path: str) -> str:
+    """The rendered or muxed video for `path` (MP4 or MKV), None when neither exists yet"""
+    for candidate in (path, f"{os.path.splitext(path)[0]}.mkv"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def write_placeholder_video(path: str):
+    """A 1-frame 1920x1080 black video, written when the video is delivered without subtitles"""
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'color=c=black:s=1920x1080:r=1',
+        '-frames:v', '1', '-pix_fmt', 'yuv420p', path
+    ], check=True)
+
+def subtitle_track_args(tracks, first_input: int):
+    """ffmpeg input and output arguments for subtitle `tracks`, a list of (path, language tag, title).
+
+    The tracks are read as inputs `first_input`, `first_input + 1`... and the first one is the default track."""
+    inputs, outputs = [], []
+    for k, (path, language, title) in enumerate(tracks):
+        inputs.extend(['-i', path])
+        outputs.extend(['-map', f'{first_input + k}:0'])
+    for k, (path, language, title) in enumerate(tracks):
+        outputs.extend([f'-metadata:s:s:{k}', f'language={language}', f'-metadata:s:s:{k}', f'title={title}'])
+    if tracks:
+        outputs.extend(['-c:s', SUBTITLE_CODECS[load_key('soft_subtitles.container')], '-disposition:s:0', 'default'])
+    return inputs, outputs
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import tempfile
+from typing import List, NamedTuple, Optional
+import numpy as np
+
+# ------------
+# SRT / VTT / ASS writer and parser shared by all stages
+# ------------
+
+WRITE_BLOCK = 10000  # cues formatted and written per block by the streaming writer
+
+DEFAULT_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,16,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+class Cues(NamedTuple):
+    """Parsed subtitle cues: `number` int array, `start` / `end` float arrays in seconds, `text` list of
+    str with the lines of a cue joined by '\\n'"""
+    number: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    text: List[str]
+
+def subtitle_format(path: str) -> str:
+    fmt = os.path.splitext(path)[1].lower().lstrip('.')
+    if fmt not in ('srt', 'vtt', 'ass'):
+        raise ValueError(f"Unsupported subtitle format: {path}")
+    return fmt
+
+def format_timestamps(seconds, fmt: str = 'srt') -> List[str]:
+    """Format an array of seconds in one pass, milliseconds are truncated like `int(seconds * 1000) % 1000`"""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    hours = np.floor_divide(seconds, 3600).astype(np.int64)
+    minutes = np.floor_divide(np.mod(seconds, 3600), 60).astype(np.int64)
+    secs = np.mod(seconds, 60)
+    whole = secs.astype(np.int64)
+    millis = (secs * 1000).astype(np.int64) % 1000
+    if fmt == 'ass':  # H:MM:SS.cc
+        return [f"{h}:{m:02d}:{s:02d}.{ms // 10:02d}" for h, m, s, ms in zip(hours.tolist(), minutes.tolist(), whole.tolist(), millis.tolist())]
+    sep = ',' if fmt == 'srt' else '.'
+    return [f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}" for h, m, s, ms in zip(hours.tolist(), minutes.tolist(), whole.tolist(), millis.tolist())]
+
+class SubtitleWriter:
+    """Streaming writer, cues can be written in several calls and are numbered continuously.
+
+    For ASS, `header` replaces the default script header and `styles` names the style of every cue."""
+
+    def __init__(self, path: str, fmt: Optional[str] = None, header: Optional[str] = None):
+        self.path = path
+        self.fmt = fmt or subtitle_format(path)
+        self.count = 0
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        if self.fmt == 'vtt':
+            self.file.write("WEBVTT\n\n")
+        elif self.fmt == 'ass':
+            self.file.write(header or DEFAULT_ASS_HEADER)
+
+    def write(self, starts, ends, texts, styles=None, timestamps=None):
+        """`timestamps` takes (start_ts, end_ts) already formatted for this format, to share them between files"""
+        for block in range(0, len(texts), WRITE_BLOCK):
+            block_end = block + WRITE_BLOCK
+            if timestamps:
+                start_ts, end_ts = timestamps[0][block:block_end], timestamps[1][block:block_end]
+            else:
+                start_ts = format_timestamps(np.asarray(starts)[block:block_end], self.fmt)
+                end_ts = format_timestamps(np.asarray(ends)[block:block_end], self.fmt)
+            block_texts = [str(text).strip() for text in texts[block:block_end]]
+            if self.fmt == 'ass':
+                block_styles = styles[block:block_end] if styles is not None else ['Default'] * len(block_texts)
+                chunk = ''.join(
+                    f"Dialogue: 0,{s},{e},{style},,0,0,0,,{text.replace(chr(10), chr(92) + 'N')}\n"
+                    for s, e, style, text in zip(start_ts, end_ts, block_styles, block_texts)
+                )
+            elif self.fmt == 'vtt':
+                chunk = ''.join(f"{s} --> {e}\n{text}\n\n" for s, e, text in zip(start_ts, end_ts, block_texts))
+            else:
+                chunk = ''.join(
+                    f"{self.count + i}\n{s} --> {e}\n{text}\n\n"
+                    for i, (s, e, text) in enumerate(zip(start_ts, end_ts, block_texts), 1)
+                )
+            self.file.write(chunk)
+            self.count += len(block_texts)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_subtitles(path: str, starts, ends, texts, fmt: Optional[str] = None, header: Optional[str] = None, styles=None):
+    """Write cues to an SRT / VTT / ASS file, the format follows the extension unless `fmt` is given"""
+    with SubtitleWriter(path, fmt, header) as writer:
+        writer.write(starts, ends, list(texts), styles)
+
+def write_subtitle_variants(starts, ends, variants):
+    """Write several files over the same timeline, `variants` is a list of (path, texts).
+
+    Timestamps are formatted once per subtitle format and shared by all files."""
+    formatted = {}
+    for path, texts in variants:
+        fmt = subtitle_format(path)
+        if fmt not in formatted:
+            formatted[fmt] = (format_timestamps(starts, fmt), format_timestamps(ends, fmt))
+        with SubtitleWriter(path, fmt) as writer:
+            writer.write(starts, ends, list(texts), timestamps=formatted[fmt])
+
+_BLOCK_SPLIT = re.compile(r'\r?\n[ \t]*\r?\n')
+_TIMING_REGEX = re.compile(r'(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{1,3})')
+_ASS_REGEX = re.compile(r'^Dialogue:[^,]*,(\d+):(\d{2}):(\d{2})\.(\d{2}),(\d+):(\d{2}):(\d{2})\.(\d{2}),(?:[^,]*,){6}(.*)$', re.M)
+
+def _to_seconds(h, m, s, frac, scale):
+    return np.array(h, dtype=np.float64) * 3600 + np.array(m, dtype=np.float64) * 60 + np.array(s, dtype=np.float64) + np.array(frac, dtype=np.float64) / scale
+
+def parse_subtitles(content: str, fmt: str = 'srt') -> Cues:
+    """Parse subtitle text into typed cue arrays, cue lines are stripped and empty lines dropped"""
+    content = content.lstrip('\ufeff')
+    if fmt == 'ass':
+        matches = _ASS_REGEX.findall(content)
+        columns = list(zip(*matches)) if matches else [()] * 9
+        start = _to_seconds(*columns[0:4], 100)
+        end = _to_seconds(*columns[4:8], 100)
+        text = [t.replace('\\N', '\n').strip() for t in columns[8]]
+        number = np.arange(1, len(text) + 1)
+    else:
+        numbers, timings, text = [], [], []
+        for block in _BLOCK_SPLIT.split(content.strip()):
+            lines = [line.strip() for line in block.split('\n') if line.strip()]
+            # the timing line is first (VTT without cue ids) or second (SRT, VTT with cue ids)
+            for pos in (0, 1):
+                timing = _TIMING_REGEX.match(lines[pos]) if pos < len(lines) else None
+                if timing:
+                    break
+            if not timing:
+                continue  # WEBVTT header, NOTE / STYLE blocks or a broken cue
+            numbers.append(int(lines[0]) if pos == 1 and lines[0].isdigit() else len(numbers) + 1)
+            timings.append(timing.groups())
+            text.append('\n'.join(lines[pos + 1:]))
+        columns = list(zip(*timings)) if timings else [()] * 8
+        # fractions are milliseconds, pad short ones ("1:02:03,5" means 500 ms)
+        start = _to_seconds(*columns[0:3], [frac.ljust(3, '0') for frac in columns[3]], 1000)
+        end = _to_seconds(*columns[4:7], [frac.ljust(3, '0') for frac in columns[7]], 1000)
+        number = numbers
+    return Cues(number=np.asarray(number, dtype=np.int64), start=start, end=end, text=text)
+
+def read_subtitles(path: str, fmt: Optional[str] = None) -> Cues:
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_subtitles(f.read(), fmt or subtitle_format(path))
+
+def benchmark(n: int = 100_000, folder: Optional[str] = None):
+    """Write and parse n cues in every format, print cues per second"""
+    starts = np.cumsum(np.full(n, 2.5))
+    ends = starts + 2.0
+    texts = [f"Subtitle line {i}\n字幕 {i}" for i in range(n)]
+    for fmt in ('srt', 'vtt', 'ass'):
+        path = os.path.join(folder or tempfile.gettempdir(), f"subtitle_io_benchmark.{fmt}")
+        start_time = time.perf_counter()
+        write_subtitles(path, starts, ends, texts)
+        write_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        cues = read_subtitles(path)
+        read_time = time.perf_counter() - start_time
+        assert len(cues.text) == n and cues.text[-1] == texts[-1]
+        print(f"{fmt}: write {n / write_time:,.0f} cues/s, parse {n / read_time:,.0f} cues/s")
+        os.remove(path)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,77 @@
+from collections import deque
+
+# ------------
+# Aho-Corasick index over terminology sources
+# ------------
+
+class TermIndex:
+    """Find every terminology entry whose `src` occurs in a text with a single linear scan.
+
+    Matching is case-insensitive. With `word_boundary`, a term whose edge is a letter or digit only
+    matches when the neighbouring character is not one (for space-delimited languages, so `AI`
+    does not match inside `said`)."""
+
+    def __init__(self, terms, word_boundary=False):
+        self.terms = terms
+        self.word_boundary = word_boundary
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for idx, term in enumerate(terms):
+            key = str(term['src']).lower()
+            if not key.strip():
+                continue
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((idx, len(key)))
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _at_boundary(self, text, start, end):
+        if start > 0 and text[start].isalnum() and text[start - 1].isalnum():
+            return False
+        if end < len(text) and text[end - 1].isalnum() and text[end].isalnum():
+            return False
+        return True
+
+    def search(self, text):
+        """Return the indices of the matched terms, in terminology order"""
+        text = text.lower()
+        found = set()
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for idx, length in self._out[node]:
+                if idx in found:
+                    continue
+                if self.word_boundary and not self._at_boundary(text, pos - length + 1, pos + 1):
+                    continue
+                found.add(idx)
+        return sorted(found)
+
+if __name__ == "__main__":
+    terms = [{'src': 'AI'}, {'src': 'machine learning'}, {'src': 'learning'}, {'src': 'C++'}, {'src': '机器学习'}]
+    index = TermIndex(terms, word_boundary=True)
+    print(index.search("He said Machine Learning in C++ and AI, 机器学习"))  # [0, 1, 2, 3, 4]
+    print(index.search("She said the plain truth"))  # []
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import random
+import numpy as np
+
+# ------------
+# persistent translation memory shared across videos
+# ------------
+
+NUM_PERM = 32
+BANDS, ROWS = 8, 4  # LSH bands over the MinHash signature, NUM_PERM == BANDS * ROWS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(42)
+_A = np.array([_rng.randrange(1, 1 << 31) for _ in range(NUM_PERM)], dtype=np.uint64)
+_B = np.array([_rng.randrange(0, 1 << 31) for _ in range(NUM_PERM)], dtype=np.uint64)
+
+def normalize_sentence(text):
+    """Lower-case, drop punctuation and collapse whitespace, so trivial differences still hit"""
+    text = re.sub(r'[^\w\s]', '', str(text).lower())
+    return ' '.join(text.split())
+
+def glossary_version(terms):
+    """Short hash of the (src, tgt) terminology pairs that apply to a sentence"""
+    pairs = sorted(f"{term['src']}\t{term['tgt']}" for term in terms)
+    return hashlib.md5('\n'.join(pairs).encode('utf-8')).hexdigest()[:8]
+
+def _shingles(norm, n=3):
+    if len(norm) <= n:
+        return {norm}
+    return {norm[i:i + n] for i in range(len(norm) - n + 1)}
+
+def _minhash(shingles):
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.uint64)
+    # (a * x + b) mod p for every permutation, the products stay below 2^63
+    return ((np.outer(_A, hashes) + _B[:, None]) % np.uint64(_PRIME)).min(axis=1).tolist()
+
+class TranslationMemory:
+    """Sentence translations keyed by normalized source + target language + glossary version.
+
+    Exact lookups are a dict hit. Near-duplicates are found through MinHash LSH buckets over character
+    3-grams and verified with the exact Jaccard similarity. Numbers must match for a near hit. Near lookups are
+    off unless `near_threshold` is below 1, a near hit reuses another sentence's translation unchanged."""
+
+    def __init__(self, path, target_language, near_threshold=1.0):
+        self.path = path
+        self.target_language = target_language
+        self.near_threshold = near_threshold
+        self.entries = {}
+        self.buckets = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        for key, entry in self.entries.items():
+            self._index(key, entry)
+
+    def _key(self, norm, glossary):
+        return f"{self.target_language}|{glossary}|{norm}"
+
+    def _bands(self, glossary, signature):
+        for b in range(BANDS):
+            yield (self.target_language, glossary, b, tuple(signature[b * ROWS:(b + 1) * ROWS]))
+
+    def _index(self, key, entry):
+        if entry['lang'] != self.target_language:
+            return
+        for band in self._bands(entry['glossary'], entry['sig']):
+            self.buckets.setdefault(band, []).append(key)
+
+    def lookup(self, sentence, glossary):
+        """Return (translation, 'exact' | 'near') or (None, None)"""
+        norm = normalize_sentence(sentence)
+        if not norm:
+            return None, None
+        entry = self.entries.get(self._key(norm, glossary))
+        if entry:
+            return entry['tgt'], 'exact'
+        if self.near_threshold >= 1:
+            return None, None
+
+        shingles = _shingles(norm)
+        digits = re.findall(r'\d+', norm)
+        candidates = {key for band in self._bands(glossary, _minhash(shingles)) for key in self.buckets.get(band, [])}
+        best, best_sim = None, self.near_threshold
+        for key in candidates:
+            entry = self.entries[key]
+            if re.findall(r'\d+', entry['src']) != digits:
+                continue
+            other = _shingles(entry['src'])
+            sim = len(shingles & other) / len(shingles | other)
+            if sim >= best_sim:
+                best, best_sim = entry, sim
+        return (best['tgt'], 'near') if best else (None, None)
+
+    def add(self, sentence, glossary, translation):
+        norm = normalize_sentence(sentence)
+        if not norm or not str(translation).strip():
+            return
+        key = self._key(norm, glossary)
+        if key in self.entries:
+            self.entries[key]['tgt'] = translation
+            return
+        entry = {'src': norm, 'tgt': translation, 'lang': self.target_language, 'glossary': glossary, 'sig': _minhash(_shingles(norm))}
+        self.entries[key] = entry
+        self._index(key, entry)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+
+if __name__ == "__main__":
+    tm = TranslationMemory('/tmp/tm_test.json', '简体中文', near_threshold=0.8)
+    tm.add("Welcome back to the channel, everyone!", 'g', "欢迎回到频道，大家好！")
+    print(tm.lookup("welcome back to the channel everyone", 'g'))  # exact
+    print(tm.lookup("Welcome back to the channel, everybody!", 'g'))  # near
+    print(tm.lookup("Welcome back to the channel, everyone!", 'other'))  # other glossary, miss
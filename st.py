@@ -5,6 +5,7 @@ from core import *
 # Reduce torchaudio deprecation warnings in logs
 os.environ.setdefault("TORCHAUDIO_USE_BACKEND_DISPATCHER", "1")
 from core.utils.config_utils import load_key
+from core.utils.mux import delivered_video
 
 # SET PATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -33,13 +34,13 @@ def text_processing_section():
             6. {t("Merging subtitles into the video")}
         """, unsafe_allow_html=True)
 
-        if not os.path.exists(SUB_VIDEO):
+        if not delivered_video(SUB_VIDEO):
             if st.button(t("Start Processing Subtitles"), key="text_processing_button"):
                 process_text()
                 st.rerun()
         else:
-            if load_key("burn_subtitles"):
-                st.video(SUB_VIDEO)
+            if load_key("burn_subtitles") or load_key("soft_subtitles.enabled"):
+                st.video(delivered_video(SUB_VIDEO))
             download_subtitle_zip_button(text=t("Download All Srt Files"))
             
             if st.button(t("Archive to 'history'"), key="cleanup_in_text_processing"):
@@ -79,14 +80,14 @@ def audio_processing_section():
             3. {t("Generate and merge audio files")}<br>
             4. {t("Merge final audio into video")}
         """, unsafe_allow_html=True)
-        if not os.path.exists(DUB_VIDEO):
+        if not delivered_video(DUB_VIDEO):
             if st.button(t("Start Audio Processing"), key="audio_processing_button"):
                 process_audio()
                 st.rerun()
         else:
             st.success(t("Audio processing is complete! You can check the audio files in the `output` folder."))
-            if load_key("burn_subtitles"):
-                st.video(DUB_VIDEO) 
+            if load_key("burn_subtitles") or load_key("soft_subtitles.enabled"):
+                st.video(delivered_video(DUB_VIDEO)) 
             if st.button(t("Delete dubbing files"), key="delete_dubbing_files"):
                 delete_dubbing_files()
                 st.rerun()
@@ -0,0 +1,100 @@
+"""process_srt must build the same audio task table, and print the same messages, as the former
+datetime-based merge loop it replaced.
+
+Run from the repository root: python -m pytest tests"""
+import datetime
+import random
+import re
+
+import pandas as pd
+
+import core._8_1_audio_task as audio_task
+from core._8_1_audio_task import time_diff_seconds
+from core.utils import load_key, rprint
+from core.utils.subtitle_io import read_subtitles
+
+def seconds_to_time(seconds):
+    return (datetime.datetime.min + datetime.timedelta(milliseconds=round(seconds * 1000))).time()
+
+def former_process_srt(trans_path, src_path):
+    """The former process_srt: time objects and df.loc writes in a while loop"""
+    cues = read_subtitles(trans_path)
+    src_cues = read_subtitles(src_path)
+    src_subtitles = {number: text.replace('\n', ' ') for number, text in zip(src_cues.number.tolist(), src_cues.text) if text}
+
+    subtitles = []
+    for number, start, end, text in zip(cues.number.tolist(), cues.start.tolist(), cues.end.tolist(), cues.text):
+        if not text:
+            continue
+        start_time = seconds_to_time(start)
+        end_time = seconds_to_time(end)
+        duration = time_diff_seconds(start_time, end_time, datetime.date.today())
+        text = text.replace('\n', ' ')
+        text = re.sub(r'\([^)]*\)', '', text).strip()
+        text = re.sub(r'（[^）]*）', '', text).strip()
+        text = text.replace('-', '')
+        origin = src_subtitles.get(number, '')
+        subtitles.append({'number': number, 'start_time': start_time, 'end_time': end_time, 'duration': duration, 'text': text, 'origin': origin})
+
+    df = pd.DataFrame(subtitles)
+    i = 0
+    MIN_SUB_DUR = load_key("min_subtitle_duration")
+    while i < len(df):
+        today = datetime.date.today()
+        if df.loc[i, 'duration'] < MIN_SUB_DUR:
+            if i < len(df) - 1 and time_diff_seconds(df.loc[i, 'start_time'], df.loc[i+1, 'start_time'], today) < MIN_SUB_DUR:
+                rprint(f"[bold yellow]Merging subtitles {i+1} and {i+2}[/bold yellow]")
+                df.loc[i, 'text'] += ' ' + df.loc[i+1, 'text']
+                df.loc[i, 'origin'] += ' ' + df.loc[i+1, 'origin']
+                df.loc[i, 'end_time'] = df.loc[i+1, 'end_time']
+                df.loc[i, 'duration'] = time_diff_seconds(df.loc[i, 'start_time'], df.loc[i, 'end_time'], today)
+                df = df.drop(i+1).reset_index(drop=True)
+            else:
+                if i < len(df) - 1:
+                    rprint(f"[bold blue]Extending subtitle {i+1} duration to {MIN_SUB_DUR} seconds[/bold blue]")
+                    df.loc[i, 'end_time'] = (datetime.datetime.combine(today, df.loc[i, 'start_time']) +
+                                            datetime.timedelta(seconds=MIN_SUB_DUR)).time()
+                    df.loc[i, 'duration'] = MIN_SUB_DUR
+                else:
+                    rprint(f"[bold red]The last subtitle {i+1} duration is less than {MIN_SUB_DUR} seconds, but not extending[/bold red]")
+                i += 1
+        else:
+            i += 1
+
+    df['start_time'] = df['start_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
+    df['end_time'] = df['end_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
+    return df
+
+def srt_time(ms):
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def random_srt_pair(rng):
+    """Translation and source SRT text with short, long, close and distant cues, empty cues and removable characters"""
+    trans, src, t = [], [], rng.randint(0, 5000)
+    for number in range(1, rng.randint(1, 40) + 1):
+        start = t + rng.choice([0, rng.randint(0, 800), rng.randint(800, 4000)])
+        end = start + rng.choice([rng.randint(100, 2500), rng.randint(2500, 8000)])
+        text = rng.choice(['你好', '我们继续', 'well-known (note) 例子', '（旁白）开始吧', 'line one\nline two', ''])
+        trans.append(f"{number}\n{srt_time(start)} --> {srt_time(end)}\n{text}\n")
+        origin = rng.choice(['Hello', 'Go on', 'a\nb', ''])
+        src.append(f"{number}\n{srt_time(start)} --> {srt_time(end)}\n{origin}\n")
+        t = end
+    return '\n'.join(trans), '\n'.join(src)
+
+def test_matches_former_process_srt(tmp_path, monkeypatch, capsys):
+    rng = random.Random(0)
+    trans_path, src_path = tmp_path / 'trans_subs_for_audio.srt', tmp_path / 'src_subs_for_audio.srt'
+    monkeypatch.setattr(audio_task, 'TRANS_SUBS_FOR_AUDIO_FILE', str(trans_path))
+    monkeypatch.setattr(audio_task, 'SRC_SUBS_FOR_AUDIO_FILE', str(src_path))
+    for _ in range(200):
+        trans, src = random_srt_pair(rng)
+        trans_path.write_text(trans, encoding='utf-8')
+        src_path.write_text(src, encoding='utf-8')
+        if not any(read_subtitles(str(trans_path)).text):
+            continue
+        capsys.readouterr()
+        expected = former_process_srt(str(trans_path), str(src_path))
+        expected_output = capsys.readouterr().out
+        df = audio_task.process_srt()
+        assert capsys.readouterr().out == expected_output
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
@@ -0,0 +1,37 @@
+"""_best_split_point must pick the same split as the exhaustive scan it replaced.
+
+Run from the repository root: python -m pytest tests"""
+import random
+from difflib import SequenceMatcher
+
+from core._3_2_split_meaning import _best_split_point
+
+WORDS = ['the', 'a', 'model', 'we', 'trained', 'last', 'year', 'was', 'evaluated', 'on', 'same', 'benchmark',
+         'and', 'it', 'worked', '我们', '模型', '训练', 'で', 'す']
+
+def exhaustive_split_point(original, start, target):
+    """The former loop of find_split_positions: the first `j` with the highest ratio"""
+    max_similarity, best_split = 0, None
+    for j in range(start, len(original)):
+        similarity = SequenceMatcher(None, original[start:j], target).ratio()
+        if similarity > max_similarity:
+            max_similarity, best_split = similarity, j
+    return max_similarity, best_split
+
+def random_case(rng):
+    original = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+    start = rng.randint(0, len(original) // 2)
+    # the LLM's left part: a prefix of the rest, sometimes with words dropped, changed or spaces removed
+    words = original[start:].split()[:rng.randint(0, 8)]
+    if words and rng.random() < 0.3:
+        words.pop(rng.randrange(len(words)))
+    if words and rng.random() < 0.3:
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    joiner = '' if rng.random() < 0.3 else ' '
+    return original, start, joiner.join(words)
+
+def test_matches_exhaustive_scan():
+    rng = random.Random(0)
+    for _ in range(3000):
+        original, start, target = random_case(rng)
+        assert _best_split_point(original, start, target) == exhaustive_split_point(original, start, target), (original, start, target)
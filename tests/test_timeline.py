@@ -0,0 +1,50 @@
+"""postprocess_timeline and format_timestamps must give the timestamps of the former per-row align_timestamp code.
+
+Run from the repository root: python -m pytest tests"""
+import random
+
+import numpy as np
+
+from core._6_gen_sub import postprocess_timeline
+from core.utils.subtitle_io import format_timestamps
+
+def convert_to_srt_format(start_time, end_time):
+    """The former per-cue SRT time formatting"""
+    def seconds_to_hmsm(seconds):
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        seconds = seconds % 60
+        milliseconds = int(seconds * 1000) % 1000
+        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
+    return f"{seconds_to_hmsm(start_time)} --> {seconds_to_hmsm(end_time)}"
+
+def former_timeline(time_stamp_list):
+    """The former gap removal of align_timestamp, return (timestamp strings, durations)"""
+    timestamps = list(time_stamp_list)
+    durations = [end - start for start, end in timestamps]
+    for i in range(len(timestamps) - 1):
+        delta_time = timestamps[i + 1][0] - timestamps[i][1]
+        if 0 < delta_time < 1:
+            timestamps[i] = (timestamps[i][0], timestamps[i + 1][0])
+    return [convert_to_srt_format(start, end) for start, end in timestamps], durations
+
+def random_timeline(rng):
+    """Word-aligned cues: mostly increasing, with sub-second and longer gaps, touching and overlapping cues"""
+    time_stamp_list, t = [], rng.uniform(0, 5)
+    for _ in range(rng.randint(0, 60)):
+        start = round(t + rng.choice([0, rng.uniform(-0.3, 0), rng.uniform(0, 1), rng.uniform(1, 4)]), rng.choice([2, 3, 6]))
+        start = max(start, 0.0)
+        end = round(start + rng.uniform(0, 6), rng.choice([2, 3, 6]))
+        time_stamp_list.append((start, end))
+        t = end
+    return time_stamp_list
+
+def test_matches_former_align_timestamp():
+    rng = random.Random(0)
+    for _ in range(200):
+        time_stamp_list = random_timeline(rng)
+        expected_timestamps, expected_durations = former_timeline(time_stamp_list)
+        cues = postprocess_timeline([x[0] for x in time_stamp_list], [x[1] for x in time_stamp_list])
+        timestamps = [f"{s} --> {e}" for s, e in zip(format_timestamps(cues['start']), format_timestamps(cues['end']))]
+        assert timestamps == expected_timestamps
+        assert np.array_equal(cues['duration'], np.array(expected_durations, dtype=float))